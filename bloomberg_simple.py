@@ -1,10 +1,24 @@
 import os.path
+import re
 import json
+import hashlib
+import asyncio
+import sqlite3
 import requests
 import time
+import queue
+import random
+import base64
+import html
+import secrets
 import threading
 from datetime import datetime, timedelta
+from urllib.parse import urlsplit, parse_qs
 import email.utils
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -58,65 +72,1190 @@ else:
 # SCOPES yang diperlukan untuk mengakses Gmail
 SCOPES = ['https://www.googleapis.com/auth/gmail.readonly']
 
-# File untuk menyimpan ID email terakhir yang diproses
-LAST_PROCESSED_ID_FILE = 'last_email_id.txt'
+# File untuk menyimpan cursor sinkronisasi Gmail (historyId + ID email terakhir)
+SYNC_STATE_FILE = 'gmail_sync_state.json'
+LAST_PROCESSED_ID_FILE = 'last_email_id.txt'  # Format lama, hanya untuk migrasi
 LAST_EMAIL_DATA_FILE = 'last_email_data.json'
 STATUS_FILE = 'monitoring_status.json'
-SUBSCRIBERS_FILE = 'subscribers.json'
+SUBSCRIBERS_FILE = 'subscribers.json'  # Format lama; sekarang hanya untuk migrasi dan import/export
+TELEGRAM_OFFSET_FILE = 'telegram_offset.json'
+STATE_DB_FILE = 'bot_state.db'  # SQLite untuk state yang perlu bertahan setelah restart
+
+# Sumber email: setiap feed dikompilasi jadi query Gmail sempit + filter regex header di sisi bot
+SOURCE_RULES_FILE = 'source_rules.json'  # Opsional, menggantikan SOURCE_RULES
+SOURCE_RULES = [
+    {
+        'name': 'bloomberg_alerts',
+        'title': 'Bloomberg Alert',
+        'from': ['noreply@news.bloomberg.com'],
+        'newer_than': '2d',
+        'exclude_subject_regex': r'^\s*(re|fwd?|fw)\s*:'
+    }
+]
+SOURCE_RULE_KEYS = {'name', 'title', 'from', 'label', 'subject', 'newer_than',
+                    'subject_regex', 'exclude_subject_regex', 'from_regex'}
+
+# Gmail incremental sync
+FULL_SYNC_MAX_RESULTS = 10  # Batas email saat fallback full list (cursor expired)
+SYNC_RECENT_IDS_LIMIT = 200  # Jumlah ID email terakhir yang diingat untuk dedup
+
+# Gmail client dibangun sekali dan dipakai ulang antar poll
+CREDS_REFRESH_MARGIN = 300  # Refresh token jika akan expired dalam 5 menit
+
+# Beberapa mailbox (opsional): masing-masing punya credentials dan cursor historyId sendiri
+GMAIL_ACCOUNTS_FILE = 'gmail_accounts.json'
+DEFAULT_GMAIL_ACCOUNT = {'name': 'default', 'credentials_env': 'GOOGLE_CREDENTIALS_JSON', 'token_file': 'token.json'}
+MAILBOX_POLL_WORKERS = 8  # Mailbox yang di-poll bersamaan
+MESSAGE_ID_DEDUP_WINDOW = 2000  # Message-ID terakhir yang diingat untuk dedup antar mailbox
+
+# Hanya ambil header yang dipakai bot, gabungkan beberapa get dalam satu batch request
+GMAIL_METADATA_HEADERS = ['Subject', 'Date', 'From', 'Message-ID']
+GMAIL_BATCH_LIMIT = 50  # Batas request per batch yang disarankan Gmail
+# Email di history dengan label ini tidak mungkin alert (balasan sendiri, draft, spam)
+HISTORY_SKIP_LABELS = {'SENT', 'DRAFT', 'SPAM', 'TRASH', 'CHAT'}
+
+# Broadcast paralel ke subscribers lewat koneksi keep-alive yang di-pool
+BROADCAST_CONCURRENCY = 20
+
+# Outbox: job kirim per (alert, subscriber) disimpan di SQLite, dikirim ulang sampai berhasil
+OUTBOX_MAX_ATTEMPTS = 8
+OUTBOX_CHUNK = 200  # Job per putaran fan-out, di-ack setelah setiap putaran
+OUTBOX_POLL_INTERVAL = 5  # Detik antar pengecekan job retry
+OUTBOX_RETENTION = 24 * 3600  # Job yang sudah selesai dihapus setelah 1 hari
+OUTBOX_CLEANUP_INTERVAL = 3600  # Detik antar pembersihan outbox (dijalankan saat worker delivery idle)
+
+# Pipeline: poller -> (analysis, delivery), dihubungkan queue terbatas
+POLL_INTERVAL = 30  # Interval dasar poll Gmail (detik, dihitung dari awal poll sebelumnya)
+DELIVERY_WORKERS = 2  # Alert yang dikirim bersamaan (fan-out per alert tetap BROADCAST_CONCURRENCY)
+PIPELINE_QUEUE_SIZE = 100
+PIPELINE_REPORT_INTERVAL = 300
+
+# Interval poll adaptif: rapat saat jam pasar / ada email baru, renggang saat sepi
+POLL_MIN_INTERVAL = 10  # Interval saat jam pasar dan setelah ada email baru
+POLL_MAX_INTERVAL = 600  # Batas backoff saat sepi atau kena quota Gmail
+POLL_ACTIVE_WINDOW = 15 * 60  # Detik setelah email terakhir interval tetap rapat
+POLL_IDLE_THRESHOLD = 6  # Poll kosong berturut-turut sebelum mulai backoff
+GMAIL_DAILY_API_BUDGET = 12000  # Request Gmail API per hari (UTC), interval dilebarkan supaya cukup
+# Jam pasar (UTC, hari kerja Senin=0): rilis data AS 8:30 ET + pembukaan NY, FOMC, pembukaan Asia
+MARKET_WINDOWS_UTC = [
+    ((0, 1, 2, 3, 4), '12:15', '15:00'),
+    ((0, 1, 2, 3, 4), '17:55', '20:05'),
+    ((0, 1, 2, 3, 4), '00:00', '02:30'),
+]
+
+# Filter topik per subscriber (/follow, /mute): keyword dan /a|b/ (alternatif keyword) via Aho-Corasick
+TOPIC_MAX_RULES_PER_CHAT = 50
+TOPIC_MAX_PATTERN_LENGTH = 100
+
+# Subscriber yang memblokir bot / chat-nya hilang dinonaktifkan otomatis
+DEAD_CHAT_THRESHOLD = 2  # Error permanen berturut-turut sebelum dinonaktifkan
+PERMANENT_TELEGRAM_ERRORS = [
+    'bot was blocked by the user',
+    'user is deactivated',
+    'bot was kicked',
+    'bot is not a member',
+    'chat not found',
+    'user not found',
+    'peer_id_invalid',
+    'have no rights to send'
+]
+
+# Rate limit Telegram Bot API: ~30 pesan/detik global, ~1 pesan/detik per chat
+TELEGRAM_GLOBAL_RATE = 30
+TELEGRAM_CHAT_RATE = 1
+TELEGRAM_CHAT_BURST = 3
+TELEGRAM_MAX_RETRIES = 5
+TELEGRAM_CHAT_BUCKETS_LIMIT = 10000  # Bucket per chat yang idle dibuang di atas batas ini
+
+# Long polling getUpdates: server Telegram menahan request sampai ada update
+TELEGRAM_LONG_POLL_TIMEOUT = 50
+TELEGRAM_ALLOWED_UPDATES = ['message', 'callback_query']
+LISTENER_MAX_BACKOFF = 30
+
+# Mode webhook: update Telegram diterima HTTP server lokal, bukan lewat getUpdates
+TELEGRAM_UPDATE_MODE = os.getenv('TELEGRAM_UPDATE_MODE', 'polling')  # 'polling' atau 'webhook'
+TELEGRAM_WEBHOOK_URL = os.getenv('TELEGRAM_WEBHOOK_URL', '')  # URL publik, mis. https://bot.example.com/telegram-webhook
+# Selalu ada secret: tanpa env dibuat acak per proses dan didaftarkan lewat setWebhook
+TELEGRAM_WEBHOOK_SECRET = os.getenv('TELEGRAM_WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+TELEGRAM_WEBHOOK_PATH = '/telegram-webhook'
+HTTP_SERVER_HOST = os.getenv('HTTP_SERVER_HOST', '127.0.0.1')  # Set 0.0.0.0 hanya jika port memang harus publik
+HTTP_SERVER_PORT = int(os.getenv('HTTP_SERVER_PORT', '8443'))
+HTTP_MAX_BODY = 1024 * 1024
+
+# Gmail push (users.watch -> Pub/Sub push ke HTTP server lokal): email baru langsung di-sync
+GMAIL_PUSH_TOPIC = os.getenv('GMAIL_PUSH_TOPIC', '')  # projects/<id>/topics/<topic>, 'local' = tanpa users.watch
+GMAIL_PUSH_TOKEN = os.getenv('GMAIL_PUSH_TOKEN', '')  # Dicek dari ?token= di URL push subscription
+GMAIL_PUSH_PATH = '/gmail-push'
+GMAIL_WATCH_RENEW_MARGIN = 24 * 3600  # Watch berlaku 7 hari, diperbarui 1 hari sebelum habis
+GMAIL_WATCH_RETRY = 300
+GMAIL_PUSH_STALE_AFTER = 30 * 60  # Tanpa notifikasi selama ini -> kembali ke polling adaptif
+GMAIL_PUSH_SAFETY_INTERVAL = POLL_MAX_INTERVAL  # Poll cadangan saat push sehat
+
+# Dispatcher update: handler jalan paralel, update dari chat yang sama tetap berurutan
+UPDATE_WORKERS = 16
+HANDLER_LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]  # Detik
+UPDATE_DEDUP_WINDOW = 1000  # Jumlah update_id terakhir yang diingat
+
+# Alert dikirim dulu, AI analysis dibuat di background
+AI_ANALYSIS_WORKERS = 8  # Worker stage analysis; menunggu hasil batch, jadi minimal sebesar AI_BATCH_MAX
+AI_ON_DEMAND_WAIT = 60  # Maksimal tunggu analysis saat tombol diklik sebelum siap
+AI_STREAM_WORKERS = 32  # Thread yang menunggu analysis untuk tombol, terpisah dari worker dispatch
+AI_DEADLINE_SECONDS = 25  # Batas waktu generate per alert, lewat dari ini dibatalkan
+ALERT_METRICS_LIMIT = 200
+
+# Cache AI analysis: LRU + TTL di memori, disimpan juga ke SQLite (set False untuk memori saja)
+ANALYSIS_CACHE_SIZE = 500
+ANALYSIS_CACHE_TTL = 3 * 24 * 3600  # 3 hari
+ANALYSIS_CACHE_PERSIST = True
+
+# Memo AI analysis untuk headline yang sama / hampir sama (mis. alert + newsletter)
+AI_MEMO_NEAR_DUPLICATES = True
+AI_MEMO_SIMILARITY = 0.75  # Estimasi Jaccard minimal untuk dianggap near-duplicate
+AI_MEMO_INDEX_SIZE = 1000
+MINHASH_PERMUTATIONS = 128
+MINHASH_BANDS = 32
+
+# Dedup headline lintas mailbox/feed sebelum masuk outbox (UPDATE 1:, (Corrected), " - Bloomberg")
+HEADLINE_DEDUP_ENABLED = True
+HEADLINE_DEDUP_WINDOW = 6 * 3600  # Detik headline lama masih dianggap cerita yang sama
+HEADLINE_DEDUP_SIZE = 2000  # Batas fingerprint yang disimpan
+HEADLINE_DEDUP_SIMILARITY = 0.8  # Estimasi Jaccard MinHash minimal
+HEADLINE_SIMHASH_DISTANCE = 3  # Beda bit SimHash 64-bit maksimal
+
+# Pemilihan backend Gemini: probe sekali, circuit breaker per tier, re-probe di background
+GEMINI_MODEL_NAME = 'gemini-pro'
+AI_BACKEND_TIERS = ['generative_model', 'generate_text', 'rest']
+AI_BREAKER_THRESHOLD = 3  # Gagal berturut-turut sebelum tier dimatikan
+AI_BREAKER_COOLDOWN = 600  # Detik sebelum tier yang mati di-probe ulang
+AI_REPROBE_INTERVAL = 60
+AI_REST_TIMEOUT = 30
+
+# Micro-batching: headline yang masuk berdekatan dianalisis dalam satu prompt
+AI_BATCH_WINDOW = 2.0  # Detik menunggu headline lain sebelum prompt dikirim
+AI_BATCH_MAX = 8
+AI_BATCH_BUDGET = 10  # Detik untuk satu panggilan batch; headline dengan sisa waktu < 2x ini tidak di-batch
 
 # Global status monitoring
 monitoring_active = False
 last_update_offset = 0
 subscribers = set()  # Set of chat IDs yang subscribe
+_subscribers_lock = threading.RLock()
+_gmail_clients = {}  # nama akun -> {'service', 'creds', 'production', 'lock'}
+_gmail_clients_lock = threading.Lock()
+_gmail_accounts = None
+gmail_client_stats = {
+    'builds': 0,
+    'last_build_seconds': None,
+    'refreshes': 0,
+    'last_refresh_seconds': None,
+    'auth_failures': 0
+}
+gmail_push_state = {
+    'watch_expiration': 0.0,  # Paling awal di antara semua mailbox
+    'watch_started': 0.0,
+    'watches': {},  # nama akun -> {'expiration', 'next_attempt'}
+    'last_notification': 0.0,
+    'healthy': False,
+    'notifications': 0,
+    'stale_notifications': 0,
+    'renewals': 0,
+    'watch_failures': 0,
+    'fallbacks': 0
+}
+_gmail_push_event = threading.Event()  # Di-set handler push untuk membangunkan poller
+telegram_scheduler_stats = {
+    'queued': 0,
+    'sent': 0,
+    'throttled': 0,
+    'retries': 0,
+    'gave_up': 0
+}
+topic_stats = {
+    'alerts': 0,
+    'recipients': 0,
+    'filtered_out': 0,  # Job kirim yang tidak dibuat karena filter topik
+    'index_builds': 0
+}
+_topic_index = None  # Dibangun ulang setelah /follow, /mute, dst.
+_topic_index_lock = threading.Lock()
+subscriber_prune_stats = {
+    'pruned': 0,
+    'failing': 0,
+    'avg_send_seconds': 0.0
+}
+broadcast_stats = {
+    'broadcasts': 0,
+    'last': None
+}
+_pending_analyses = {}  # alert_id -> Future analysis yang sedang dibuat
+_pending_analyses_lock = threading.Lock()
+_partial_analyses = {}  # alert_id -> teks analysis yang sudah di-stream sejauh ini
+alert_metrics = OrderedDict()  # alert_id -> timing email masuk, terkirim, analysis siap
+_alert_metrics_lock = threading.Lock()
+ai_memo_stats = {
+    'hits': 0,
+    'near_hits': 0,
+    'misses': 0
+}
+_gemini_model = None
+ai_backend_state = {
+    tier: {'failures': 0, 'open_until': 0, 'calls': 0, 'last_error': None}
+    for tier in AI_BACKEND_TIERS
+}
+_ai_backend_lock = threading.Lock()
+_ai_batch_pending = []  # (headline, Future, on_text, deadline) yang menunggu dikirim
+_ai_batch_timer = None
+_ai_batch_lock = threading.Lock()
+ai_batch_stats = {
+    'batches': 0,
+    'headlines_batched': 0,
+    'api_calls_saved': 0,
+    'fallbacks': 0
+}
+outbox_stats = {
+    'enqueued_alerts': 0,
+    'enqueued_jobs': 0,
+    'sent': 0,
+    'retried': 0,
+    'failed': 0
+}
+_alerts_in_delivery = set()  # alert_id yang sedang dikirim worker delivery
+_alerts_in_delivery_lock = threading.Lock()
+_outbox_cleanup = {'next': 0.0}
+_outbox_cleanup_lock = threading.Lock()
+_analysis_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)  # (alert_id, headline, Future)
+_delivery_queue = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)  # alert_id
+pipeline_stats = {
+    stage: {'processed': 0, 'busy_seconds': 0.0, 'shed': 0, 'errors': 0}
+    for stage in ('poller', 'analysis', 'delivery')
+}
+_pipeline_stats_lock = threading.Lock()
+source_stats = {
+    'candidates': 0,  # Email yang dikembalikan query Gmail
+    'unmatched': 0,  # Ditolak semua feed (filter regex)
+    'feeds': {}  # name -> {'matched': n}
+}
+_source_feeds = None  # Dikompilasi sekali saat pertama dipakai
+fetch_stats = {
+    'messages': 0,
+    'bytes_fetched': 0,
+    'bytes_saved': 0,
+    'round_trips': 0,
+    'round_trips_saved': 0,
+    'api_calls': 0  # Semua request Gmail API (list, history, get; request dalam batch dihitung satu-satu)
+}
+_fetch_stats_lock = threading.Lock()
+
+# Satu session HTTP untuk semua request ke Telegram (koneksi TLS dipakai ulang); pool cukup untuk
+# semua pemakai bersamaan (broadcast, worker dispatch, edit analysis, thread utama) supaya tidak ada
+# koneksi yang dibuang karena "Connection pool is full"
+TELEGRAM_POOL_SIZE = BROADCAST_CONCURRENCY + UPDATE_WORKERS + AI_STREAM_WORKERS + 2
+telegram_session = requests.Session()
+telegram_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=TELEGRAM_POOL_SIZE))
+# Session terpisah untuk getUpdates supaya long poll tidak memakai koneksi broadcast
+_updates_session = requests.Session()
+_broadcast_executor = ThreadPoolExecutor(max_workers=BROADCAST_CONCURRENCY, thread_name_prefix='broadcast')
+_ai_stream_executor = ThreadPoolExecutor(max_workers=AI_STREAM_WORKERS, thread_name_prefix='ai-stream')
+
+_state_db = None
+_state_db_lock = threading.RLock()
+
+def get_state_db():
+    """Koneksi SQLite bersama (WAL), dipakai bersama _state_db_lock"""
+    global _state_db
+    with _state_db_lock:
+        if _state_db is None:
+            _state_db = sqlite3.connect(STATE_DB_FILE, check_same_thread=False)
+            _state_db.execute('PRAGMA journal_mode=WAL')
+            _state_db.execute('PRAGMA synchronous=NORMAL')
+        return _state_db
+
+class AnalysisStore:
+    """Cache AI analysis per alert_id dengan eviction LRU + TTL dan persistensi SQLite opsional"""
+    
+    def __init__(self, max_entries, ttl, persist=True):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persist = persist
+        self.entries = OrderedDict()  # alert_id -> (created, headline, analysis)
+        self.lock = threading.Lock()
+        self.db_ready = False
+    
+    def _db(self):
+        db = get_state_db()
+        if not self.db_ready:
+            with _state_db_lock:
+                db.execute('CREATE TABLE IF NOT EXISTS ai_analysis ('
+                           'alert_id TEXT PRIMARY KEY, headline TEXT, analysis TEXT, created REAL)')
+                db.execute('CREATE INDEX IF NOT EXISTS ai_analysis_created ON ai_analysis (created)')
+                db.commit()
+            self.db_ready = True
+        return db
+    
+    def _remember(self, alert_id, entry):
+        self.entries[alert_id] = entry
+        self.entries.move_to_end(alert_id)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def get(self, alert_id):
+        """Kembalikan {'headline', 'analysis'} atau None jika tidak ada/expired"""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(alert_id)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self.entries.move_to_end(alert_id)
+                    return {'headline': entry[1], 'analysis': entry[2]}
+                del self.entries[alert_id]
+        
+        if not self.persist:
+            return None
+        
+        # Tidak ada di memori (mis. setelah restart): cek SQLite
+        try:
+            db = self._db()
+            with _state_db_lock:
+                row = db.execute('SELECT created, headline, analysis FROM ai_analysis WHERE alert_id = ?',
+                                 (alert_id,)).fetchone()
+        except sqlite3.Error as e:
+            print(f"⚠️ Analysis store read error: {e}")
+            return None
+        if row is None or now - row[0] > self.ttl:
+            return None
+        with self.lock:
+            self._remember(alert_id, tuple(row))
+        return {'headline': row[1], 'analysis': row[2]}
+    
+    def put(self, alert_id, headline, analysis):
+        """Simpan analysis; entry terlama dibuang jika melebihi batas"""
+        entry = (time.time(), headline, analysis)
+        with self.lock:
+            self._remember(alert_id, entry)
+        
+        if not self.persist:
+            return
+        try:
+            db = self._db()
+            with _state_db_lock:
+                db.execute('INSERT OR REPLACE INTO ai_analysis (alert_id, created, headline, analysis) '
+                           'VALUES (?, ?, ?, ?)', (alert_id,) + entry)
+                # Buang yang expired dan batasi jumlah baris di disk
+                db.execute('DELETE FROM ai_analysis WHERE created < ?', (entry[0] - self.ttl,))
+                db.execute('DELETE FROM ai_analysis WHERE alert_id NOT IN '
+                           '(SELECT alert_id FROM ai_analysis ORDER BY created DESC LIMIT ?)',
+                           (self.max_entries,))
+                db.commit()
+        except sqlite3.Error as e:
+            print(f"⚠️ Analysis store write error: {e}")
+    
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+analysis_store = AnalysisStore(ANALYSIS_CACHE_SIZE, ANALYSIS_CACHE_TTL, ANALYSIS_CACHE_PERSIST)
+
+_HEADLINE_PREFIX_RE = re.compile(
+    r'^\s*(?:(?:breaking(?:\s+news)?|update(?:\s*\d+)?|exclusive|corrected)\s*[:\-–—|]\s*)+', re.IGNORECASE)
+
+_HEADLINE_SUFFIX_RE = re.compile(
+    r'\s*(?:\((?:corrected|updated?(?:\s*\d+)?|correction)\)|[-–—|]\s*bloomberg(?:\s+news)?)\s*$', re.IGNORECASE)
+
+_HEADLINE_NUMBER_RE = re.compile(r'\d+(?:[.,]\d+)*%?')
+
+def _strip_headline_tags(headline):
+    """Buang prefix BREAKING:/UPDATE 1: dan suffix (Corrected)/- Bloomberg"""
+    text = _HEADLINE_PREFIX_RE.sub('', headline)
+    previous = None
+    while text != previous:
+        previous, text = text, _HEADLINE_SUFFIX_RE.sub('', text)
+    return text
+
+def normalize_headline(headline):
+    """Normalisasi headline: buang prefix BREAKING:/UPDATE, suffix (Corrected)/- Bloomberg, huruf kecil, tanpa tanda baca"""
+    text = re.sub(r'[^\w\s]', ' ', _strip_headline_tags(headline).lower())
+    return ' '.join(text.split())
+
+def headline_numbers(headline):
+    """Multiset angka di headline (4.25%, 150,000); near-duplicate hanya jika angkanya sama persis"""
+    return tuple(sorted(number.replace(',', '') for number in _HEADLINE_NUMBER_RE.findall(_strip_headline_tags(headline))))
+
+def headline_shingles(normalized, size=5):
+    """Character shingles dari headline yang sudah dinormalisasi"""
+    if len(normalized) <= size:
+        return {normalized}
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+class MinHashIndex:
+    """Index MinHash + LSH band untuk mencari headline near-duplicate, ukuran dibatasi (FIFO)"""
+    
+    _PRIME = (1 << 61) - 1
+    
+    def __init__(self, num_perm=MINHASH_PERMUTATIONS, bands=MINHASH_BANDS, max_entries=AI_MEMO_INDEX_SIZE):
+        rng = random.Random(1337)  # Seed tetap supaya signature stabil antar proses
+        self.params = [(rng.randrange(1, self._PRIME), rng.randrange(0, self._PRIME)) for _ in range(num_perm)]
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.max_entries = max_entries
+        self.signatures = OrderedDict()  # key -> signature
+        self.buckets = {}  # (band, hash band) -> set(key)
+        self.lock = threading.Lock()
+    
+    def signature(self, normalized):
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+                  for shingle in headline_shingles(normalized)]
+        return tuple(min((a * h + b) % self._PRIME for h in hashes) for a, b in self.params)
+    
+    def _band_keys(self, signature):
+        return [(band, signature[band * self.rows:(band + 1) * self.rows]) for band in range(self.bands)]
+    
+    def _unlink(self, key, signature):
+        for band_key in self._band_keys(signature):
+            bucket = self.buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self.buckets[band_key]
+    
+    def add(self, key, signature):
+        with self.lock:
+            if key in self.signatures:
+                return
+            self.signatures[key] = signature
+            for band_key in self._band_keys(signature):
+                self.buckets.setdefault(band_key, set()).add(key)
+            while len(self.signatures) > self.max_entries:
+                old_key, old_signature = self.signatures.popitem(last=False)
+                self._unlink(old_key, old_signature)
+    
+    def remove(self, key):
+        with self.lock:
+            signature = self.signatures.pop(key, None)
+            if signature is not None:
+                self._unlink(key, signature)
+    
+    def query(self, signature, threshold, accept=None):
+        """Kembalikan (key, similarity) paling mirip di atas threshold (dan lolos accept(key)), atau (None, 0.0)"""
+        with self.lock:
+            candidates = set()
+            for band_key in self._band_keys(signature):
+                candidates.update(self.buckets.get(band_key, ()))
+            scored = []
+            for key in candidates:
+                other = self.signatures[key]
+                similarity = sum(1 for x, y in zip(signature, other) if x == y) / len(signature)
+                if similarity >= threshold:
+                    scored.append((similarity, key))
+        for similarity, key in sorted(scored, reverse=True):
+            if accept is None or accept(key):
+                return key, similarity
+        return None, 0.0
+
+_memo_index = MinHashIndex()
+
+def simhash(normalized, bits=64):
+    """SimHash dari character shingles; headline yang mirip hanya beda sedikit bit"""
+    weights = [0] * bits
+    for shingle in headline_shingles(normalized):
+        h = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(bits):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(bits) if weights[bit] > 0)
+
+class HeadlineDedupIndex:
+    """Fingerprint headline terbaru (exact hash + SimHash + MinHash) dalam jendela waktu, ukuran dibatasi"""
+    
+    def __init__(self, window=HEADLINE_DEDUP_WINDOW, max_entries=HEADLINE_DEDUP_SIZE,
+                 similarity=HEADLINE_DEDUP_SIMILARITY, max_distance=HEADLINE_SIMHASH_DISTANCE):
+        self.window = window
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self.max_distance = max_distance
+        # Jarak <= max_distance menjamin minimal satu blok 64-bit sama (pigeonhole)
+        self.blocks = max_distance + 1
+        self.block_bits = 64 // self.blocks
+        self.entries = OrderedDict()  # digest -> (headline, seen, simhash, angka), urut waktu masuk
+        self.simhash_buckets = {}  # (blok, nilai) -> set(digest)
+        self.minhash = MinHashIndex(max_entries=max_entries)
+        self.lock = threading.Lock()
+        self.stats = {'checked': 0, 'exact': 0, 'simhash': 0, 'minhash': 0}
+    
+    def _simhash_keys(self, value):
+        mask = (1 << self.block_bits) - 1
+        return [(block, value >> (block * self.block_bits) & mask) for block in range(self.blocks)]
+    
+    def _evict(self, digest):
+        _, _, value, _ = self.entries.pop(digest)
+        for bucket_key in self._simhash_keys(value):
+            bucket = self.simhash_buckets.get(bucket_key)
+            if bucket is not None:
+                bucket.discard(digest)
+                if not bucket:
+                    del self.simhash_buckets[bucket_key]
+        self.minhash.remove(digest)
+    
+    def _expire(self, now):
+        while self.entries:
+            digest, (_, seen, _, _) = next(iter(self.entries.items()))
+            if now - seen < self.window and len(self.entries) <= self.max_entries:
+                return
+            self._evict(digest)
+    
+    def _fingerprint(self, headline):
+        normalized = normalize_headline(headline)
+        return normalized, hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+    
+    def check(self, headline, now=None):
+        """Kembalikan (jenis, headline asli, skor) jika duplikat headline dalam jendela waktu, selain itu None"""
+        now = now or time.time()
+        normalized, digest = self._fingerprint(headline)
+        if not normalized:
+            return None
+        # "Yield Rises to 4.25%" vs "4.35%" beda satu karakter tapi berita berbeda
+        numbers = headline_numbers(headline)
+        with self.lock:
+            self._expire(now)
+            self.stats['checked'] += 1
+            if digest in self.entries:
+                self.stats['exact'] += 1
+                return 'exact', self.entries[digest][0], 1.0
+            
+            value = simhash(normalized)
+            for bucket_key in self._simhash_keys(value):
+                for other in self.simhash_buckets.get(bucket_key, ()):
+                    distance = bin(value ^ self.entries[other][2]).count('1')
+                    if distance <= self.max_distance and self.entries[other][3] == numbers:
+                        self.stats['simhash'] += 1
+                        return 'simhash', self.entries[other][0], 1 - distance / 64
+            
+            signature = self.minhash.signature(normalized)
+            match, similarity = self.minhash.query(
+                signature, self.similarity, accept=lambda key: self.entries[key][3] == numbers)
+            if match is not None:
+                self.stats['minhash'] += 1
+                return 'minhash', self.entries[match][0], similarity
+            return None
+    
+    def add(self, headline, now=None):
+        """Simpan fingerprint headline yang sudah masuk outbox"""
+        now = now or time.time()
+        normalized, digest = self._fingerprint(headline)
+        if not normalized:
+            return
+        value = simhash(normalized)
+        signature = self.minhash.signature(normalized)
+        with self.lock:
+            if digest in self.entries:
+                return
+            self.entries[digest] = (headline, now, value, headline_numbers(headline))
+            for bucket_key in self._simhash_keys(value):
+                self.simhash_buckets.setdefault(bucket_key, set()).add(digest)
+            self.minhash.add(digest, signature)
+            self._expire(now)
+    
+    def get_stats(self):
+        with self.lock:
+            suppressed = self.stats['exact'] + self.stats['simhash'] + self.stats['minhash']
+            # Setiap duplikat = satu broadcast dan satu panggilan LLM yang tidak terjadi
+            return dict(self.stats, suppressed=suppressed, tracked=len(self.entries))
+
+headline_dedup = HeadlineDedupIndex()
+
+def memoized_ai_analysis(headline, on_text=None, deadline=None):
+    """generate_ai_analysis() dengan memo berbasis headline yang dinormalisasi (+ near-duplicate)"""
+    started = time.time()
+    normalized = normalize_headline(headline)
+    memo_key = 'memo:' + hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+    
+    cached = analysis_store.get(memo_key)
+    if cached:
+        ai_memo_stats['hits'] += 1
+        print(f"♻️ AI memo hit ({(time.time() - started) * 1e6:.0f}µs): {headline[:50]}")
+        return cached['analysis']
+    
+    signature = None
+    if AI_MEMO_NEAR_DUPLICATES and normalized:
+        signature = _memo_index.signature(normalized)
+        # Analysis untuk "rate 6.25%" tidak boleh dipakai untuk "rate 6.50%"
+        numbers = headline_numbers(headline)
+        
+        def same_numbers(key):
+            entry = analysis_store.get(key)
+            return entry is not None and headline_numbers(entry['headline']) == numbers
+        
+        match_key, similarity = _memo_index.query(signature, AI_MEMO_SIMILARITY, accept=same_numbers)
+        cached = analysis_store.get(match_key) if match_key else None
+        if cached:
+            ai_memo_stats['near_hits'] += 1
+            print(f"♻️ AI memo near-duplicate hit (similarity {similarity:.2f}, "
+                  f"{(time.time() - started) * 1e6:.0f}µs): {headline[:50]}")
+            return cached['analysis']
+    
+    ai_memo_stats['misses'] += 1
+    analysis = submit_for_analysis(headline, on_text, deadline).result()
+    if analysis is None:
+        # Di worker ini sendiri: fallback berjalan paralel, dengan deadline dan streaming masing-masing
+        analysis = generate_ai_analysis(headline, on_text, deadline)
+    # Teks yang terpotong deadline tidak di-memo, headline berikutnya dibuat ulang
+    if analysis and not isinstance(analysis, TruncatedText):
+        analysis_store.put(memo_key, headline, analysis)
+        if signature is not None:
+            _memo_index.add(memo_key, signature)
+    return analysis
+
+class TokenBucket:
+    """Token bucket thread-safe; reserve() mengembalikan berapa detik harus menunggu"""
+    
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def reserve(self):
+        """Ambil satu token; token boleh minus supaya antrian dilayani berurutan"""
+        with self.lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+    
+    def pause(self, seconds):
+        """Kosongkan bucket selama `seconds` (dipakai saat Telegram membalas 429)"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.tokens, -seconds * self.rate)
+    
+    def is_idle(self):
+        with self.lock:
+            self._refill(time.monotonic())
+            return self.tokens >= self.capacity
+
+_global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_RATE)
+_chat_buckets = {}
+_chat_buckets_lock = threading.Lock()
+_scheduler_stats_lock = threading.Lock()
+
+def _get_chat_bucket(chat_id):
+    """Bucket per chat, dibuat saat pertama kali dipakai"""
+    with _chat_buckets_lock:
+        bucket = _chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(_chat_buckets) >= TELEGRAM_CHAT_BUCKETS_LIMIT:
+                for idle_chat_id in [cid for cid, b in _chat_buckets.items() if b.is_idle()]:
+                    del _chat_buckets[idle_chat_id]
+            bucket = TokenBucket(TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST)
+            _chat_buckets[chat_id] = bucket
+        return bucket
+
+def _wait_for_send_slot(chat_id):
+    """Tunggu sampai bucket per chat dan bucket global mengizinkan kirim"""
+    with _scheduler_stats_lock:
+        telegram_scheduler_stats['queued'] += 1
+    try:
+        if chat_id:
+            delay = _get_chat_bucket(str(chat_id)).reserve()
+            if delay > 0:
+                time.sleep(delay)
+        delay = _global_bucket.reserve()
+        if delay > 0:
+            time.sleep(delay)
+    finally:
+        with _scheduler_stats_lock:
+            telegram_scheduler_stats['queued'] -= 1
+
+def get_telegram_queue_depth():
+    """Jumlah request Telegram yang sedang menunggu slot rate limit"""
+    return telegram_scheduler_stats['queued']
+
+def _count_scheduler_event(key):
+    # Dipanggil dari banyak thread broadcast sekaligus
+    with _scheduler_stats_lock:
+        telegram_scheduler_stats[key] += 1
+
+def get_telegram_scheduler_stats():
+    """Salinan statistik scheduler Telegram"""
+    with _scheduler_stats_lock:
+        return dict(telegram_scheduler_stats)
+
+def _retry_delay(attempt):
+    """Exponential backoff dengan jitter"""
+    return min(30, 2 ** attempt) * (0.5 + random.random())
+
+def telegram_api_call(method, payload=None, chat_id=None, timeout=10, rate_limited=True):
+    """Panggil Telegram Bot API lewat scheduler rate limit; retry 429 (retry_after), 5xx, dan error koneksi"""
+    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/{method}"
+    response = None
+    
+    for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+        if attempt:
+            _count_scheduler_event('retries')
+        if rate_limited:
+            _wait_for_send_slot(chat_id)
+        
+        try:
+            response = telegram_session.post(url, data=payload, timeout=timeout)
+        except requests.RequestException as e:
+            print(f"⚠️ Telegram {method} connection error (attempt {attempt + 1}): {e}")
+            response = None
+            time.sleep(_retry_delay(attempt))
+            continue
+        
+        if response.status_code == 429:
+            _count_scheduler_event('throttled')
+            try:
+                retry_after = response.json().get('parameters', {}).get('retry_after', 1)
+            except ValueError:
+                retry_after = 1
+            print(f"⏳ Telegram rate limit on {method}, retry after {retry_after}s")
+            # Tahan pengiriman lain ke chat ini (atau semua chat) selama retry_after
+            bucket = _get_chat_bucket(str(chat_id)) if chat_id else _global_bucket
+            bucket.pause(retry_after)
+            time.sleep(retry_after + random.random())
+            continue
+        
+        if response.status_code >= 500:
+            print(f"⚠️ Telegram {method} server error {response.status_code} (attempt {attempt + 1})")
+            time.sleep(_retry_delay(attempt))
+            continue
+        
+        if response.status_code == 200:
+            _count_scheduler_event('sent')
+        return response
+    
+    _count_scheduler_event('gave_up')
+    print(f"❌ Telegram {method} failed after {TELEGRAM_MAX_RETRIES + 1} attempts")
+    return response
+
+_subscriber_table_ready = False
+
+def _subscriber_db():
+    """Tabel subscribers di SQLite; saat pertama dibuat, subscribers.json lama di-import"""
+    global _subscriber_table_ready
+    db = get_state_db()
+    if _subscriber_table_ready:
+        return db
+    with _state_db_lock:
+        exists = db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'subscribers'").fetchone()
+        db.execute('CREATE TABLE IF NOT EXISTS subscribers ('
+                   'chat_id TEXT PRIMARY KEY, active INTEGER NOT NULL DEFAULT 1, joined REAL, updated REAL, '
+                   'fail_count INTEGER NOT NULL DEFAULT 0, last_error TEXT)')
+        columns = [row[1] for row in db.execute('PRAGMA table_info(subscribers)')]
+        if 'fail_count' not in columns:
+            db.execute('ALTER TABLE subscribers ADD COLUMN fail_count INTEGER NOT NULL DEFAULT 0')
+            db.execute('ALTER TABLE subscribers ADD COLUMN last_error TEXT')
+        db.commit()
+    _subscriber_table_ready = True
+    if not exists and os.path.exists(SUBSCRIBERS_FILE):
+        print(f"📦 Migrating {SUBSCRIBERS_FILE} to SQLite...")
+        import_subscribers(SUBSCRIBERS_FILE)
+    return db
 
 def load_subscribers():
-    """Load list subscribers dari file"""
+    """Load subscribers aktif dari SQLite ke set di memori (cek membership O(1))"""
     global subscribers
-    if os.path.exists(SUBSCRIBERS_FILE):
-        try:
-            with open(SUBSCRIBERS_FILE, 'r') as f:
-                data = json.load(f)
-                subscribers = set(str(chat_id) for chat_id in data.get('subscribers', []))
-                print(f"📱 Loaded {len(subscribers)} subscribers")
-        except:
-            subscribers = set()
-    else:
+    try:
+        db = _subscriber_db()
+        with _state_db_lock:
+            rows = db.execute('SELECT chat_id, fail_count FROM subscribers WHERE active = 1').fetchall()
+        with _subscribers_lock:
+            subscribers = set(row[0] for row in rows)
+        # Lanjutkan hitungan error permanen dari sebelum restart
+        with _subscriber_failures_lock:
+            _subscriber_failures.clear()
+            _subscriber_failures.update((chat_id, fail_count) for chat_id, fail_count in rows if fail_count)
+            subscriber_prune_stats['failing'] = len(_subscriber_failures)
+        print(f"📱 Loaded {len(subscribers)} subscribers")
+    except sqlite3.Error as e:
+        print(f"❌ Error loading subscribers: {e}")
         subscribers = set()
 
-def save_subscribers():
-    """Simpan list subscribers ke file"""
-    try:
-        data = {
-            'subscribers': list(subscribers),
-            'updated': time.time()
-        }
-        with open(SUBSCRIBERS_FILE, 'w') as f:
-            json.dump(data, f)
-        print(f"💾 Saved {len(subscribers)} subscribers")
-    except Exception as e:
-        print(f"❌ Error saving subscribers: {e}")
+def _set_subscriber_active(chat_id, active):
+    """Upsert satu baris subscriber (satu transaksi kecil, bukan rewrite seluruh file)"""
+    now = time.time()
+    db = _subscriber_db()
+    with _state_db_lock:
+        db.execute('INSERT INTO subscribers (chat_id, active, joined, updated) VALUES (?, ?, ?, ?) '
+                   'ON CONFLICT(chat_id) DO UPDATE SET active = excluded.active, updated = excluded.updated',
+                   (chat_id, int(active), now, now))
+        db.commit()
+
+def import_subscribers(path):
+    """Bulk import chat ID dari file JSON ({"subscribers": [...]}) atau list JSON"""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    chat_ids = [str(chat_id) for chat_id in (data.get('subscribers', []) if isinstance(data, dict) else data)]
+    now = time.time()
+    db = _subscriber_db()
+    with _state_db_lock:
+        db.executemany('INSERT INTO subscribers (chat_id, active, joined, updated) VALUES (?, 1, ?, ?) '
+                       'ON CONFLICT(chat_id) DO UPDATE SET active = 1, updated = excluded.updated',
+                       [(chat_id, now, now) for chat_id in chat_ids])
+        db.commit()
+    with _subscribers_lock:
+        subscribers.update(chat_ids)
+    print(f"📥 Imported {len(chat_ids)} subscribers from {path}")
+    return len(chat_ids)
+
+def export_subscribers(path):
+    """Export subscribers aktif ke file JSON (format subscribers.json lama), ditulis atomic"""
+    db = _subscriber_db()
+    with _state_db_lock:
+        chat_ids = [row[0] for row in db.execute('SELECT chat_id FROM subscribers WHERE active = 1')]
+    tmp_file = path + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump({'subscribers': chat_ids, 'updated': time.time()}, f)
+    os.replace(tmp_file, path)
+    print(f"📤 Exported {len(chat_ids)} subscribers to {path}")
+    return len(chat_ids)
 
 def add_subscriber(chat_id):
     """Tambahkan subscriber baru"""
     global subscribers
     chat_id = str(chat_id)
-    if chat_id not in subscribers:
+    with _subscribers_lock:
+        if chat_id in subscribers:
+            return False
         subscribers.add(chat_id)
-        save_subscribers()
-        print(f"➕ Added new subscriber: {chat_id}")
-        return True
-    return False
+    try:
+        _set_subscriber_active(chat_id, True)
+    except sqlite3.Error as e:
+        print(f"❌ Error saving subscriber {chat_id}: {e}")
+    print(f"➕ Added new subscriber: {chat_id}")
+    return True
 
 def remove_subscriber(chat_id):
     """Hapus subscriber"""
     global subscribers
     chat_id = str(chat_id)
-    if chat_id in subscribers:
+    with _subscribers_lock:
+        if chat_id not in subscribers:
+            return False
         subscribers.remove(chat_id)
-        save_subscribers()
-        print(f"➖ Removed subscriber: {chat_id}")
-        return True
-    return False
+    try:
+        _set_subscriber_active(chat_id, False)
+    except sqlite3.Error as e:
+        print(f"❌ Error saving subscriber {chat_id}: {e}")
+    print(f"➖ Removed subscriber: {chat_id}")
+    return True
+
+class AhoCorasick:
+    """Automaton Aho-Corasick: semua pola yang muncul di teks, waktu sebanding panjang teks"""
+    
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [set()]
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(set())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].add(pattern)
+        
+        # BFS: fail link = state dengan suffix terpanjang, output ikut digabung
+        pending = deque(self.goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, child in self.goto[state].items():
+                pending.append(child)
+                if state:
+                    fallback = self.fail[state]
+                    while fallback and char not in self.goto[fallback]:
+                        fallback = self.fail[fallback]
+                    self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+    
+    def search(self, text):
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if self.output[state]:
+                found |= self.output[state]
+        return found
+
+_TOPIC_ALTERNATIVE_RE = re.compile(r"[\w\s&'.,-]+")
+
+def _normalize_keyword(keyword):
+    return ' '.join(re.sub(r'[^\w\s]', ' ', keyword.lower()).split())
+
+def normalize_topic(pattern):
+    """Keyword topik dinormalisasi seperti headline; /a|b c/ = salah satu keyword (bukan regex bebas)"""
+    pattern = pattern.strip()
+    if len(pattern) > 2 and pattern.startswith('/') and pattern.endswith('/'):
+        # Regex dari user tidak pernah dijalankan (backtracking bisa menahan poller): hanya alternatif literal
+        alternatives = pattern[1:-1].split('|')
+        if not all(_TOPIC_ALTERNATIVE_RE.fullmatch(alternative) for alternative in alternatives):
+            raise ValueError("only /word|other words/ alternatives are supported")
+        keywords = sorted(set(filter(None, (_normalize_keyword(alternative) for alternative in alternatives))))
+        if not keywords:
+            return '', True
+        return '/' + '|'.join(keywords) + '/', True
+    return _normalize_keyword(pattern), False
+
+def topic_keywords(pattern, is_regex):
+    """Keyword yang dimasukkan ke automaton untuk satu rule"""
+    return pattern[1:-1].split('|') if is_regex else [pattern]
+
+class TopicIndex:
+    """Index semua rule /follow dan /mute: keyword -> chat, dicocokkan sekali per headline"""
+    
+    def __init__(self, rules):
+        self.keywords = {}  # ' keyword ' -> {'follow': set(chat), 'mute': set(chat)}
+        self.following = set()  # chat yang hanya mau headline sesuai /follow
+        for chat_id, kind, pattern, is_regex in rules:
+            if is_regex:
+                try:
+                    # Rule lama bisa berisi regex bebas; hanya bentuk /a|b/ yang dipakai
+                    pattern, _ = normalize_topic(pattern)
+                except ValueError:
+                    print(f"⚠️ Ignoring unsupported topic rule {pattern!r} of chat {chat_id}")
+                    continue
+            if kind == 'follow':
+                self.following.add(chat_id)
+            for keyword in topic_keywords(pattern, is_regex):
+                # Spasi di kedua sisi = cocok per kata utuh ('fed' tidak cocok dengan 'federal')
+                key = f' {keyword} '
+                self.keywords.setdefault(key, {'follow': set(), 'mute': set()})[kind].add(chat_id)
+        self.automaton = AhoCorasick(self.keywords)
+    
+    def recipients(self, headline, chat_ids):
+        """Subscriber yang menerima headline: tanpa /follow atau ada /follow yang cocok, dan tidak di-/mute"""
+        followed, muted = set(), set()
+        for key in self.automaton.search(f' {normalize_headline(headline)} '):
+            followed |= self.keywords[key]['follow']
+            muted |= self.keywords[key]['mute']
+        if not self.following and not muted:
+            return list(chat_ids)
+        return [chat_id for chat_id in chat_ids
+                if chat_id not in muted and (chat_id in followed or chat_id not in self.following)]
+
+_topic_table_ready = False
+
+def _topic_db():
+    global _topic_table_ready
+    db = get_state_db()
+    if not _topic_table_ready:
+        with _state_db_lock:
+            db.execute('CREATE TABLE IF NOT EXISTS subscriber_topics ('
+                       'chat_id TEXT NOT NULL, kind TEXT NOT NULL, pattern TEXT NOT NULL, '
+                       'is_regex INTEGER NOT NULL DEFAULT 0, created REAL, '
+                       'PRIMARY KEY (chat_id, kind, pattern))')
+            db.commit()
+        _topic_table_ready = True
+    return db
+
+def get_topic_index():
+    """TopicIndex dari SQLite, dibangun sekali dan dipakai sampai ada rule yang berubah"""
+    global _topic_index
+    with _topic_index_lock:
+        if _topic_index is None:
+            db = _topic_db()
+            with _state_db_lock:
+                rules = db.execute('SELECT chat_id, kind, pattern, is_regex FROM subscriber_topics').fetchall()
+            _topic_index = TopicIndex(rules)
+            topic_stats['index_builds'] += 1
+        return _topic_index
+
+def _invalidate_topic_index():
+    global _topic_index
+    with _topic_index_lock:
+        _topic_index = None
+
+def get_subscriber_topics(chat_id):
+    """Rule topik satu chat: {'follow': [...], 'mute': [...]}"""
+    db = _topic_db()
+    with _state_db_lock:
+        rows = db.execute('SELECT kind, pattern FROM subscriber_topics WHERE chat_id = ? ORDER BY created',
+                          (str(chat_id),)).fetchall()
+    topics = {'follow': [], 'mute': []}
+    for kind, pattern in rows:
+        topics[kind].append(pattern)
+    return topics
+
+def add_subscriber_topic(chat_id, kind, pattern):
+    """Simpan rule /follow atau /mute; ValueError jika pola tidak valid atau batas rule tercapai"""
+    if len(pattern) > TOPIC_MAX_PATTERN_LENGTH:
+        raise ValueError(f"pattern longer than {TOPIC_MAX_PATTERN_LENGTH} characters")
+    pattern, is_regex = normalize_topic(pattern)
+    if not pattern:
+        raise ValueError("empty pattern")
+    db = _topic_db()
+    with _state_db_lock:
+        count = db.execute('SELECT COUNT(*) FROM subscriber_topics WHERE chat_id = ?', (str(chat_id),)).fetchone()[0]
+        if count >= TOPIC_MAX_RULES_PER_CHAT:
+            raise ValueError(f"maximum {TOPIC_MAX_RULES_PER_CHAT} rules per chat")
+        db.execute('INSERT OR IGNORE INTO subscriber_topics (chat_id, kind, pattern, is_regex, created) '
+                   'VALUES (?, ?, ?, ?, ?)', (str(chat_id), kind, pattern, int(is_regex), time.time()))
+        db.commit()
+    _invalidate_topic_index()
+    return pattern
+
+def remove_subscriber_topic(chat_id, kind, pattern=None):
+    """Hapus satu rule (atau semua rule jenis itu jika pattern None); kembalikan jumlah yang dihapus"""
+    db = _topic_db()
+    with _state_db_lock:
+        if pattern is None:
+            cursor = db.execute('DELETE FROM subscriber_topics WHERE chat_id = ? AND kind = ?', (str(chat_id), kind))
+        else:
+            try:
+                pattern, _ = normalize_topic(pattern)
+            except ValueError:
+                pass  # Hapus rule lama apa adanya
+            cursor = db.execute('DELETE FROM subscriber_topics WHERE chat_id = ? AND kind = ? AND pattern = ?',
+                                (str(chat_id), kind, pattern))
+        db.commit()
+    if cursor.rowcount:
+        _invalidate_topic_index()
+    return cursor.rowcount
+
+def select_recipients(headline, chat_ids):
+    """Filter daftar subscriber dengan rule topik masing-masing"""
+    try:
+        recipients = get_topic_index().recipients(headline, chat_ids)
+    except sqlite3.Error as e:
+        # Lebih baik terkirim ke semua daripada tidak terkirim sama sekali
+        print(f"❌ Error loading topic filters, sending to all subscribers: {e}")
+        recipients = list(chat_ids)
+    topic_stats['alerts'] += 1
+    topic_stats['recipients'] += len(recipients)
+    topic_stats['filtered_out'] += len(chat_ids) - len(recipients)
+    return recipients
+
+def handle_topic_command(chat_id, command, argument):
+    """/follow, /unfollow, /mute, /unmute, /topics -> teks balasan"""
+    if command == '/topics' or (command in ('/follow', '/mute') and not argument):
+        topics = get_subscriber_topics(chat_id)
+        lines = ["🎯 <b>Your Topics</b>\n"]
+        lines.append("Following: " + (html.escape(', '.join(topics['follow'])) if topics['follow'] else "everything"))
+        if topics['mute']:
+            lines.append("Muted: " + html.escape(', '.join(topics['mute'])))
+        lines.append("\n• /follow fed - only headlines mentioning a keyword")
+        lines.append("• /follow /rate cut|rate hike/ - any of several keywords")
+        lines.append("• /mute crypto - never receive a keyword")
+        lines.append("• /unfollow fed, /unmute crypto, /unfollow all")
+        return '\n'.join(lines)
+    
+    kind = 'follow' if command in ('/follow', '/unfollow') else 'mute'
+    if command in ('/follow', '/mute'):
+        try:
+            pattern = add_subscriber_topic(chat_id, kind, argument)
+        except ValueError as e:
+            return f"❌ Cannot {command[1:]} '{html.escape(argument)}': {html.escape(str(e))}"
+        if kind == 'follow':
+            return f"✅ Following <b>{html.escape(pattern)}</b>\n\nYou will only receive headlines matching your followed topics."
+        return f"🔇 Muted <b>{html.escape(pattern)}</b>"
+    
+    removed = remove_subscriber_topic(chat_id, kind, None if argument.lower() == 'all' else argument)
+    if not removed:
+        return f"ℹ️ No {kind} rule matching '{html.escape(argument)}'"
+    if kind == 'follow':
+        return f"✅ Removed {removed} followed topic(s)"
+    return f"🔊 Unmuted {removed} topic(s)"
+
+_subscriber_failures = {}  # chat_id -> jumlah error permanen berturut-turut (diisi dari fail_count saat load)
+# Dipakai bersama oleh worker broadcast: dict di atas dan counter subscriber_prune_stats
+_subscriber_failures_lock = threading.Lock()
+
+def classify_telegram_error(response):
+    """Klasifikasi respons Telegram: 'ok', 'permanent', 'rate_limited', atau 'transient'"""
+    if response is None:
+        return 'transient', 'no response'
+    if response.status_code == 200:
+        return 'ok', ''
+    try:
+        description = response.json().get('description', '')
+    except ValueError:
+        description = response.text
+    if response.status_code == 429:
+        return 'rate_limited', description
+    lowered = description.lower()
+    if response.status_code in (400, 403) and any(error in lowered for error in PERMANENT_TELEGRAM_ERRORS):
+        return 'permanent', description
+    if response.status_code == 403:
+        return 'permanent', description
+    return 'transient', description
+
+def _deactivate_dead_subscriber(chat_id, reason, failures):
+    """Nonaktifkan subscriber yang chat-nya sudah mati"""
+    with _subscribers_lock:
+        subscribers.discard(chat_id)
+    db = _subscriber_db()
+    with _state_db_lock:
+        db.execute('UPDATE subscribers SET active = 0, updated = ?, fail_count = ?, last_error = ? '
+                   'WHERE chat_id = ?', (time.time(), failures, reason, chat_id))
+        db.commit()
+    with _subscriber_failures_lock:
+        subscriber_prune_stats['pruned'] += 1
+    print(f"🧹 Pruned dead subscriber {chat_id}: {reason}")
+
+def record_delivery_result(chat_id, response, elapsed=None):
+    """Catat hasil kirim per subscriber; nonaktifkan setelah DEAD_CHAT_THRESHOLD error permanen"""
+    chat_id = str(chat_id)
+    kind, description = classify_telegram_error(response)
+    if elapsed is not None:
+        # Rata-rata bergerak durasi satu request, untuk estimasi waktu yang dihemat
+        with _subscriber_failures_lock:
+            previous = subscriber_prune_stats['avg_send_seconds']
+            subscriber_prune_stats['avg_send_seconds'] = elapsed if not previous else previous * 0.9 + elapsed * 0.1
+    
+    if kind == 'ok':
+        with _subscriber_failures_lock:
+            had_failures = _subscriber_failures.pop(chat_id, None) is not None
+            subscriber_prune_stats['failing'] = len(_subscriber_failures)
+        if had_failures:
+            try:
+                db = _subscriber_db()
+                with _state_db_lock:
+                    db.execute('UPDATE subscribers SET fail_count = 0, last_error = NULL WHERE chat_id = ?',
+                               (chat_id,))
+                    db.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Error resetting failure count for {chat_id}: {e}")
+        return kind
+    
+    if kind != 'permanent' or chat_id not in subscribers:
+        return kind
+    
+    with _subscriber_failures_lock:
+        failures = _subscriber_failures.get(chat_id, 0) + 1
+        if failures >= DEAD_CHAT_THRESHOLD:
+            _subscriber_failures.pop(chat_id, None)
+        else:
+            _subscriber_failures[chat_id] = failures
+        subscriber_prune_stats['failing'] = len(_subscriber_failures)
+    try:
+        if failures >= DEAD_CHAT_THRESHOLD:
+            _deactivate_dead_subscriber(chat_id, description, failures)
+        else:
+            db = _subscriber_db()
+            with _state_db_lock:
+                db.execute('UPDATE subscribers SET fail_count = ?, last_error = ? WHERE chat_id = ?',
+                           (failures, description, chat_id))
+                db.commit()
+    except sqlite3.Error as e:
+        print(f"⚠️ Error recording failure for {chat_id}: {e}")
+    return kind
+
+def report_pruned_subscribers(pruned_before):
+    """Log jumlah subscriber yang dipangkas dan estimasi waktu broadcast yang dihemat"""
+    pruned = subscriber_prune_stats['pruned'] - pruned_before
+    if pruned > 0:
+        saved = pruned * subscriber_prune_stats['avg_send_seconds']
+        print(f"🧹 Pruned {pruned} dead subscribers this broadcast "
+              f"({subscriber_prune_stats['pruned']} total, ~{saved:.2f}s of requests saved per future broadcast)")
 
 def get_monitoring_status():
     """Membaca status monitoring dari file"""
@@ -135,16 +1274,16 @@ def save_monitoring_status(active):
     with open(STATUS_FILE, 'w') as f:
         json.dump(status, f)
 
-def get_telegram_updates(offset=0):
-    """Mendapatkan update terbaru dari Telegram"""
+def get_telegram_updates(offset=0, timeout=TELEGRAM_LONG_POLL_TIMEOUT):
+    """Mendapatkan update terbaru dari Telegram (long polling)"""
     try:
         url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/getUpdates"
         params = {
             'offset': offset,
-            'timeout': 10,
-            'allowed_updates': ['message']  
+            'timeout': timeout,
+            'allowed_updates': json.dumps(TELEGRAM_ALLOWED_UPDATES)
         }
-        response = requests.get(url, params=params, timeout=15)
+        response = _updates_session.get(url, params=params, timeout=timeout + 10)
         
         if response.status_code == 200:
             return response.json()
@@ -163,9 +1302,8 @@ def get_telegram_updates(offset=0):
 def clear_webhook():
     """Menghapus webhook yang mungkin aktif"""
     try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/deleteWebhook"
-        response = requests.post(url, timeout=10)
-        if response.status_code == 200:
+        response = telegram_api_call('deleteWebhook', rate_limited=False)
+        if response is not None and response.status_code == 200:
             print("✅ Webhook cleared successfully")
         return response.json()
     except Exception as e:
@@ -183,7 +1321,6 @@ def send_telegram_message(text, chat_id=None, reply_to_message_id=None, parse_mo
             print("⚠️ Chat ID empty, skipping message")
             return False
         
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
         payload = {
             'chat_id': target_chat_id,
             'text': text
@@ -196,15 +1333,16 @@ def send_telegram_message(text, chat_id=None, reply_to_message_id=None, parse_mo
         if reply_to_message_id:
             payload['reply_to_message_id'] = reply_to_message_id
         
-        response = requests.post(url, data=payload, timeout=10)
+        started = time.time()
+        response = telegram_api_call('sendMessage', payload, chat_id=target_chat_id)
+        record_delivery_result(target_chat_id, response, time.time() - started)
         
-        if response.status_code == 200:
+        if response is not None and response.status_code == 200:
             return True
         else:
-            print(f"❌ Error sending message to {target_chat_id}: {response.status_code}")
-            print(f"Response: {response.text}")
-            return False
-            print(f"Response: {response.text}")
+            print(f"❌ Error sending message to {target_chat_id}: {response.status_code if response is not None else 'no response'}")
+            if response is not None:
+                print(f"Response: {response.text}")
             return False
             
     except Exception as e:
@@ -222,7 +1360,6 @@ def send_telegram_message_with_keyboard(text, chat_id=None, keyboard=None, parse
             print("⚠️ Chat ID empty, skipping message")
             return False
         
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
         payload = {
             'chat_id': target_chat_id,
             'text': text
@@ -233,86 +1370,67 @@ def send_telegram_message_with_keyboard(text, chat_id=None, keyboard=None, parse
             payload['parse_mode'] = parse_mode
         
         if keyboard:
-            import json
             payload['reply_markup'] = json.dumps(keyboard)
         
-        response = requests.post(url, data=payload, timeout=10)
+        started = time.time()
+        response = telegram_api_call('sendMessage', payload, chat_id=target_chat_id)
+        record_delivery_result(target_chat_id, response, time.time() - started)
         
-        if response.status_code == 200:
+        if response is not None and response.status_code == 200:
             return True
         else:
-            print(f"❌ Error sending message with keyboard to {target_chat_id}: {response.status_code}")
-            print(f"Response: {response.text}")
-            return False
-            print(f"Response: {response.text}")
+            print(f"❌ Error sending message with keyboard to {target_chat_id}: {response.status_code if response is not None else 'no response'}")
+            if response is not None:
+                print(f"Response: {response.text}")
             return False
             
     except Exception as e:
         print(f"❌ Error sending message with keyboard: {e}")
         return False
 
-def broadcast_to_subscribers(text):
-    """Broadcast pesan ke semua subscribers"""
-    if not subscribers:
-        print("❌ No subscribers to broadcast to")
-        return False
-    
-    success_count = 0
-    failed_count = 0
-    
-    for chat_id in subscribers.copy():  # Use copy to avoid modification during iteration
-        if send_telegram_message(text, chat_id):
-            success_count += 1
-        else:
-            failed_count += 1
-            # Optionally remove failed chat_ids (user might have blocked bot)
-    
-    print(f"📤 Broadcast sent: {success_count} success, {failed_count} failed")
-    return success_count > 0
+def _percentile(values, pct):
+    """Nearest-rank percentile dari list angka"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
 
-def broadcast_to_subscribers_with_ai(text, headline, ai_analysis):
-    """Broadcast pesan ke semua subscribers dengan inline keyboard untuk AI analysis"""
-    if not subscribers:
-        print("❌ No subscribers to broadcast to")
-        return False
+def _fan_out(send_fn, chat_ids):
+    """Jalankan send_fn(chat_id) paralel dengan concurrency terbatas, kembalikan hasil per chat"""
+    started = time.time()
     
-    success_count = 0
-    failed_count = 0
-    
-    # Create inline keyboard untuk show AI analysis
-    keyboard = {
-        "inline_keyboard": [[
-            {
-                "text": "📖 Show AI Analysis", 
-                "callback_data": f"show_ai:{len(headline)}"  # Use headline length as unique ID
-            }
-        ]]
-    }
+    def deliver(chat_id):
+        ok = send_fn(chat_id)
+        return chat_id, ok, time.time() - started
     
-    # Store AI analysis temporarily (simple in-memory storage)
-    if not hasattr(broadcast_to_subscribers_with_ai, 'ai_cache'):
-        broadcast_to_subscribers_with_ai.ai_cache = {}
+    results = list(_broadcast_executor.map(deliver, chat_ids))
+    duration = time.time() - started
     
-    broadcast_to_subscribers_with_ai.ai_cache[str(len(headline))] = {
-        'headline': headline,
-        'analysis': ai_analysis or "AI analysis not available"
+    latencies = [latency for _, ok, latency in results if ok]
+    success_count = len(latencies)
+    stats = {
+        'recipients': len(chat_ids),
+        'success': success_count,
+        'failed': len(chat_ids) - success_count,
+        'duration': duration,
+        'p50': _percentile(latencies, 50),
+        'p99': _percentile(latencies, 99),
+        'timestamp': started,
+        'first_delivery': started + min(latencies) if latencies else None
     }
-    
-    for chat_id in subscribers.copy():
-        if send_telegram_message_with_keyboard(text, chat_id, keyboard):
-            success_count += 1
-        else:
-            failed_count += 1
-    
-    print(f"📤 Broadcast with AI button sent: {success_count} success, {failed_count} failed")
-    return success_count > 0
+    broadcast_stats['broadcasts'] += 1
+    broadcast_stats['last'] = stats
+    print(f"⏱️ Delivery latency p50={stats['p50']:.2f}s p99={stats['p99']:.2f}s "
+          f"({len(chat_ids)} chats in {duration:.2f}s)")
+    return results, stats
 
 def auto_detect_chat_id():
     """Auto-detect chat ID dari pesan yang masuk"""
     global TELEGRAM_CHAT_ID
     
     try:
-        updates = get_telegram_updates()
+        updates = get_telegram_updates(timeout=0)
         if updates and updates.get('ok') and updates.get('result'):
             for update in updates['result']:
                 if 'message' in update:
@@ -361,7 +1479,7 @@ def handle_telegram_command(message):
             save_monitoring_status(True)
             response = f"🚀 Kojin Bloomberg Monitor Activated!\n\n" \
                       f"✅ Monitoring started by {username}\n" \
-                      f"📧 Checking emails every 30 seconds\n" \
+                      f"📧 Checking emails every {POLL_MIN_INTERVAL}-{POLL_MAX_INTERVAL}s (adaptive)\n" \
                       f"🔔 Headlines will be sent to all subscribers automatically\n" \
                       f"👥 Current subscribers: {len(subscribers)}\n\n" \
                       f"Commands:\n" \
@@ -384,14 +1502,14 @@ def handle_telegram_command(message):
                 response = f"📊 Kojin Bloomberg Monitor Status\n\n" \
                           f"🟢 Status: Active\n" \
                           f"� Subscribers: {len(subscribers)}\n" \
-                          f"�📧 Checking emails every 30 seconds\n" \
+                          f"�📧 Checking emails every {POLL_MIN_INTERVAL}-{POLL_MAX_INTERVAL}s (adaptive)\n" \
                           f"📰 Last News: {last_headline}\n" \
                           f"⏰ Last check: {formatted_last_check}"
             else:
                 response = f"📊 Kojin Bloomberg Monitor Status\n\n" \
                           f"🟢 Status: Active\n" \
                           f"� Subscribers: {len(subscribers)}\n" \
-                          f"�📧 Checking emails every 30 seconds\n" \
+                          f"�📧 Checking emails every {POLL_MIN_INTERVAL}-{POLL_MAX_INTERVAL}s (adaptive)\n" \
                           f"📰 No emails processed yet"
         else:
             response = f"📊 Kojin Bloomberg Monitor Status\n\n" \
@@ -407,6 +1525,10 @@ def handle_telegram_command(message):
         else:
             response = f"ℹ️ You not subscribed yet\n\nSend /start to start receiving alerts"
     
+    elif text.partition(' ')[0].split('@')[0] in ('/follow', '/unfollow', '/mute', '/unmute', '/topics'):
+        command, _, argument = text.partition(' ')
+        response = handle_topic_command(chat_id, command.split('@')[0], argument.strip())
+    
     elif text == '/subscribers':
         response = f"👥 Subscriber Info\n\n" \
                   f"📊 Total subscribers: {len(subscribers)}\n" \
@@ -434,6 +1556,9 @@ def handle_telegram_command(message):
                   f"• /test - Test bot connection\n" \
                   f"• /unsubscribe - Stop receiving alerts\n" \
                   f"• /subscribers - Show subscriber count\n" \
+                  f"• /follow &lt;keyword&gt; - Only receive matching headlines\n" \
+                  f"• /mute &lt;keyword&gt; - Never receive matching headlines\n" \
+                  f"• /topics - Show your topic filters\n" \
                   f"• /help - Show this help\n\n" \
                   f"💡 Bot runs continuously once started"
     
@@ -454,45 +1579,269 @@ def handle_callback_query(callback_query):
         answer_callback_query(query_id)
         
         if data.startswith('show_ai:'):
-            # Extract headline ID from callback data
-            headline_id = data.split(':')[1]
+            # Extract alert ID from callback data
+            alert_id = data.split(':', 1)[1]
+            analysis = get_ai_analysis(alert_id)
             
-            # Get AI analysis from cache
-            if hasattr(broadcast_to_subscribers_with_ai, 'ai_cache'):
-                ai_data = broadcast_to_subscribers_with_ai.ai_cache.get(headline_id)
-                
-                if ai_data:
-                    headline = ai_data['headline']
-                    analysis = ai_data['analysis']
-                    
-                    # Send AI analysis as new message with HTML formatting
-                    ai_message = f"<b>🤖 AI Analysis:</b>\n\n{analysis}"
-                    send_telegram_message(ai_message, chat_id)
-                    print(f"📖 Sent AI analysis to {chat_id}")
-                else:
-                    send_telegram_message("❌ AI analysis not found or expired", chat_id, parse_mode=None)
+            if analysis is None:
+                with _pending_analyses_lock:
+                    future = _pending_analyses.get(alert_id)
+                if future is None and ai_analysis_enabled():
+                    # Mis. setelah restart: buat analysis dari headline yang tersimpan di outbox
+                    alert = get_alert(alert_id)
+                    if alert:
+                        future = start_ai_analysis(alert_id, alert['headline'], wait=AI_ON_DEMAND_WAIT)
+                if future is not None:
+                    # Analysis masih dibuat: kirim paragraf pertama begitu ada, lalu edit
+                    stream_ai_analysis_to_chat(alert_id, future, chat_id)
+                    return
+                # Cek ulang: analysis bisa selesai di antara dua pengecekan
+                analysis = get_ai_analysis(alert_id)
+            
+            if analysis:
+                # Send AI analysis as new message with HTML formatting
+                ai_message = f"<b>🤖 AI Analysis:</b>\n\n{analysis}"
+                send_telegram_message(ai_message, chat_id)
+                print(f"📖 Sent AI analysis to {chat_id}")
             else:
-                send_telegram_message("❌ AI analysis not available", chat_id, parse_mode=None)
+                send_telegram_message("❌ AI analysis not available or expired", chat_id, parse_mode=None)
                 
     except Exception as e:
         print(f"❌ Error handling callback query: {e}")
 
+def send_telegram_message_get_id(text, chat_id, parse_mode='HTML'):
+    """Kirim pesan dan kembalikan message_id (None jika gagal)"""
+    payload = {'chat_id': chat_id, 'text': text}
+    if parse_mode:
+        payload['parse_mode'] = parse_mode
+    response = telegram_api_call('sendMessage', payload, chat_id=chat_id)
+    if response is None or response.status_code != 200:
+        return None
+    return response.json().get('result', {}).get('message_id')
+
+def edit_telegram_message(chat_id, message_id, text, parse_mode='HTML'):
+    """Ganti isi pesan yang sudah terkirim (editMessageText)"""
+    payload = {'chat_id': chat_id, 'message_id': message_id, 'text': text}
+    if parse_mode:
+        payload['parse_mode'] = parse_mode
+    response = telegram_api_call('editMessageText', payload, chat_id=chat_id)
+    return response is not None and response.status_code == 200
+
+def _wait_for_analysis(alert_id, future, first_paragraph, timeout):
+    """Tunggu sampai analysis selesai atau (jika first_paragraph) paragraf pertama sudah ter-stream"""
+    waited_until = time.time() + timeout
+    while time.time() < waited_until:
+        if future.done():
+            return
+        partial = _partial_analyses.get(alert_id, '')
+        if first_paragraph and '\n\n' in partial.strip():
+            return
+        time.sleep(0.2)
+
+def stream_ai_analysis_to_chat(alert_id, future, chat_id):
+    """Tampilkan analysis yang masih dibuat: placeholder → paragraf pertama → teks lengkap"""
+    message_id = send_telegram_message_get_id("<b>🤖 AI Analysis:</b>\n\n⏳ Preparing analysis...", chat_id)
+    # Menunggu analysis bisa sampai 2x AI_ON_DEMAND_WAIT, jangan tahan worker dispatch
+    _ai_stream_executor.submit(_finish_ai_stream, alert_id, future, chat_id, message_id)
+
+def _finish_ai_stream(alert_id, future, chat_id, message_id):
+    """Edit placeholder dengan paragraf pertama lalu teks lengkap begitu tersedia"""
+    try:
+        _wait_for_analysis(alert_id, future, True, AI_ON_DEMAND_WAIT)
+        if not future.done():
+            first_paragraph = _partial_analyses.get(alert_id, '').strip().split('\n\n')[0]
+            if first_paragraph and message_id:
+                edit_telegram_message(chat_id, message_id,
+                                      f"<b>🤖 AI Analysis:</b>\n\n{first_paragraph}\n\n⏳ ...")
+            _wait_for_analysis(alert_id, future, False, AI_ON_DEMAND_WAIT)
+        
+        # Analysis yang terpotong deadline tidak disimpan, tampilkan dari hasil future
+        analysis = get_ai_analysis(alert_id) or (future.result() if future.done() else None)
+        if analysis:
+            text = f"<b>🤖 AI Analysis:</b>\n\n{analysis}"
+        else:
+            text = "❌ AI analysis not available"
+        if not (message_id and edit_telegram_message(chat_id, message_id, text)):
+            send_telegram_message(text, chat_id)
+        print(f"📖 Sent AI analysis to {chat_id}")
+    except Exception as e:
+        print(f"❌ Error streaming AI analysis to {chat_id}: {e}")
+
 def answer_callback_query(query_id, text=""):
     """Answer callback query to remove loading state"""
     try:
-        url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/answerCallbackQuery"
         payload = {
             'callback_query_id': query_id,
             'text': text
         }
-        response = requests.post(url, data=payload, timeout=5)
-        return response.status_code == 200
+        response = telegram_api_call('answerCallbackQuery', payload, timeout=5)
+        return response is not None and response.status_code == 200
     except Exception as e:
         print(f"❌ Error answering callback query: {e}")
         return False
 
-def generate_ai_analysis(headline):
-    """Generate AI analysis using Google Gemini API"""
+# Session terpisah untuk REST API Gemini (koneksi dipakai ulang)
+ai_session = requests.Session()
+
+def build_analysis_prompt(headline):
+    """Prompt analisis 2 paragraf untuk satu headline"""
+    return f"""Tolong bikin penjelasan berita dengan gaya Bloomberg/Reuters, panjang 2 paragraf. Gunakan headline berikut: {headline}
+
+Paragraf pertama: jelaskan isi utama berita (siapa, apa, kapan, data/indikator utama kalau ada).
+Paragraf kedua: jelaskan konteks, dampak, atau implikasi dari berita tersebut (misalnya ke pasar, kebijakan, atau tren yang lebih luas). 
+
+Gunakan bahasa formal, padat, tapi tetap enak dibaca. Tulis dalam bahasa Indonesia."""
+
+def _get_gemini_model():
+    """GenerativeModel dibuat sekali dan dipakai ulang"""
+    global _gemini_model
+    if _gemini_model is None:
+        _gemini_model = genai.GenerativeModel(GEMINI_MODEL_NAME)
+    return _gemini_model
+
+def _remaining(deadline, default):
+    """Sisa waktu sampai deadline (atau default jika tanpa deadline)"""
+    if deadline is None:
+        return default
+    return max(0.1, deadline - time.time())
+
+class TruncatedText(str):
+    """Teks AI yang dipotong deadline: boleh ditampilkan, jangan disimpan sebagai analysis final"""
+
+def _call_generative_model(prompt, on_text=None, deadline=None):
+    """Tier 1: GenerativeModel API dengan streaming; berhenti saat deadline lewat"""
+    if not hasattr(genai, 'GenerativeModel'):
+        raise RuntimeError("GenerativeModel API not available in this genai version")
+    response = _get_gemini_model().generate_content(
+        prompt, stream=True, request_options={'timeout': _remaining(deadline, AI_REST_TIMEOUT)}
+    )
+    text = ''
+    for chunk in response:
+        try:
+            text += chunk.text
+        except ValueError:
+            continue  # Chunk tanpa teks (mis. hanya safety metadata)
+        if on_text:
+            on_text(text)
+        if deadline is not None and time.time() > deadline:
+            # Hentikan stream, jangan tahan worker sampai jawaban selesai
+            print(f"⏰ AI generation hit the {AI_DEADLINE_SECONDS}s deadline, returning partial text")
+            return TruncatedText(text.strip() + ' …') if text.strip() else None
+    return text or None
+
+def _call_generate_text(prompt, on_text=None, deadline=None):
+    """Tier 2: legacy generate_text API (versi lama); request dibatalkan saat deadline lewat"""
+    if not hasattr(genai, 'generate_text'):
+        raise RuntimeError("generate_text API not available in this genai version")
+    response = genai.generate_text(
+        model='models/text-bison-001',
+        prompt=prompt,
+        temperature=0.7,
+        max_output_tokens=800,
+        request_options={'timeout': _remaining(deadline, AI_REST_TIMEOUT)}
+    )
+    return response.result if response and response.result else None
+
+def _call_rest_api(prompt, on_text=None, deadline=None):
+    """Tier 3: direct REST API fallback"""
+    url = f"https://generativelanguage.googleapis.com/v1beta2/models/text-bison-001:generateText?key={GEMINI_API_KEY}"
+    payload = {
+        "prompt": {"text": prompt},
+        "temperature": 0.7,
+        "candidateCount": 1
+    }
+    response = ai_session.post(url, json=payload, timeout=_remaining(deadline, AI_REST_TIMEOUT))
+    if response.status_code != 200:
+        raise RuntimeError(f"REST API status {response.status_code}")
+    result = response.json()
+    candidates = result.get('candidates') or []
+    return candidates[0].get('output') if candidates else None
+
+_AI_TIER_CALLS = {
+    'generative_model': _call_generative_model,
+    'generate_text': _call_generate_text,
+    'rest': _call_rest_api
+}
+
+def _record_tier_result(tier, ok, error=None, probe=False):
+    """Update circuit breaker tier: buka setelah gagal berturut-turut, tutup saat berhasil"""
+    with _ai_backend_lock:
+        state = ai_backend_state[tier]
+        state['calls'] += 1
+        if ok:
+            if state['open_until']:
+                print(f"✅ AI backend '{tier}' is healthy again")
+            state['failures'] = 0
+            state['open_until'] = 0
+            state['last_error'] = None
+            return
+        state['failures'] += 1
+        state['last_error'] = str(error) if error else 'empty response'
+        # Probe yang gagal langsung membuka breaker
+        if probe or state['failures'] >= AI_BREAKER_THRESHOLD:
+            state['open_until'] = time.time() + AI_BREAKER_COOLDOWN
+            print(f"⛔ AI backend '{tier}' disabled for {AI_BREAKER_COOLDOWN}s: {state['last_error']}")
+
+def _call_ai_tier(tier, prompt, probe=False, on_text=None, deadline=None):
+    """Panggil satu tier dan catat hasilnya di circuit breaker"""
+    try:
+        text = _AI_TIER_CALLS[tier](prompt, on_text, deadline)
+    except Exception as e:
+        _record_tier_result(tier, False, e, probe)
+        return None
+    if text and not isinstance(text, TruncatedText):
+        text = text.strip()
+    text = text or None
+    _record_tier_result(tier, bool(text), probe=probe)
+    return text
+
+def get_active_ai_tier():
+    """Tier pertama yang breaker-nya tertutup (None jika semua mati)"""
+    with _ai_backend_lock:
+        return next((tier for tier in AI_BACKEND_TIERS if not ai_backend_state[tier]['open_until']), None)
+
+def generate_ai_text(prompt, on_text=None, deadline=None):
+    """Panggil backend AI yang sedang sehat; tier yang breaker-nya terbuka dilewati"""
+    for tier in AI_BACKEND_TIERS:
+        with _ai_backend_lock:
+            if ai_backend_state[tier]['open_until']:
+                continue
+        if deadline is not None and time.time() > deadline:
+            print("⏰ AI deadline passed, not trying other backends")
+            return None
+        print(f"🔄 Using AI backend '{tier}'...")
+        text = _call_ai_tier(tier, prompt, on_text=on_text, deadline=deadline)
+        if text:
+            return text
+    print("❌ No healthy AI backend available")
+    return None
+
+def probe_ai_backends(only_open=False):
+    """Probe tier AI (saat startup semua, setelahnya hanya yang breaker-nya terbuka dan cooldown habis)"""
+    for tier in AI_BACKEND_TIERS:
+        with _ai_backend_lock:
+            open_until = ai_backend_state[tier]['open_until']
+        if only_open and (not open_until or open_until > time.time()):
+            continue
+        ok = _call_ai_tier(tier, "Jawab dengan satu kata: OK", probe=True) is not None
+        print(f"🔍 AI backend probe '{tier}': {'ok' if ok else 'failed'}")
+        # Saat startup cukup sampai tier pertama yang sehat
+        if ok and not only_open:
+            break
+
+def ai_backend_monitor():
+    """Thread background: probe saat startup lalu re-probe tier yang mati secara berkala"""
+    probe_ai_backends()
+    print(f"🤖 Active AI backend: {get_active_ai_tier()}")
+    while True:
+        time.sleep(AI_REPROBE_INTERVAL)
+        try:
+            probe_ai_backends(only_open=True)
+        except Exception as e:
+            print(f"❌ Error probing AI backends: {e}")
+
+def generate_ai_analysis(headline, on_text=None, deadline=None):
+    """Generate AI analysis using Google Gemini API (on_text menerima teks parsial saat streaming)"""
     if not GEMINI_AVAILABLE:
         print("⚠️ Google Generative AI not installed")
         return None
@@ -502,80 +1851,109 @@ def generate_ai_analysis(headline):
         return None
     
     try:
-        genai.configure(api_key=GEMINI_API_KEY)
-        
-        prompt = f"""Tolong bikin penjelasan berita dengan gaya Bloomberg/Reuters, panjang 2 paragraf. Gunakan headline berikut: {headline}
+        analysis = generate_ai_text(build_analysis_prompt(headline), on_text, deadline)
+        if analysis:
+            print(f"✅ AI analysis generated ({len(analysis)} chars)")
+        return analysis
+    except Exception as e:
+        print(f"❌ AI analysis error: {str(e)}")
+        return None
 
+def build_batch_analysis_prompt(headlines):
+    """Satu prompt untuk beberapa headline, hasilnya diminta dalam format JSON"""
+    numbered = "\n".join(f"{i}. {headline}" for i, headline in enumerate(headlines, 1))
+    return f"""Tolong bikin penjelasan berita dengan gaya Bloomberg/Reuters untuk setiap headline berikut, masing-masing panjang 2 paragraf:
+
+{numbered}
+
+Untuk setiap headline:
 Paragraf pertama: jelaskan isi utama berita (siapa, apa, kapan, data/indikator utama kalau ada).
 Paragraf kedua: jelaskan konteks, dampak, atau implikasi dari berita tersebut (misalnya ke pasar, kebijakan, atau tren yang lebih luas). 
 
-Gunakan bahasa formal, padat, tapi tetap enak dibaca. Tulis dalam bahasa Indonesia."""
+Gunakan bahasa formal, padat, tapi tetap enak dibaca. Tulis dalam bahasa Indonesia.
 
-        # Try modern API first (if available)
-        if hasattr(genai, 'GenerativeModel'):
-            try:
-                print("🔄 Using GenerativeModel API...")
-                model = genai.GenerativeModel('gemini-pro')
-                response = model.generate_content(prompt)
-                if response and hasattr(response, 'text') and response.text:
-                    analysis = response.text.strip()
-                    print(f"✅ AI analysis generated ({len(analysis)} chars)")
-                    return analysis
-            except Exception as e:
-                print(f"❌ GenerativeModel failed: {str(e)}")
-        
-        # Try legacy API (for older versions)
+Jawab HANYA dengan JSON array tanpa teks lain, format: [{{"id": 1, "analysis": "paragraf 1\\n\\nparagraf 2"}}, ...]"""
+
+def parse_batch_analysis(text, count):
+    """Parse jawaban JSON batch menjadi {nomor headline: analysis}"""
+    start, end = text.find('['), text.rfind(']')
+    if start == -1 or end <= start:
+        return {}
+    try:
+        items = json.loads(text[start:end + 1])
+    except ValueError:
+        return {}
+    
+    results = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
         try:
-            print("🔄 Using legacy generate_text API...")
-            response = genai.generate_text(
-                model='models/text-bison-001',
-                prompt=prompt,
-                temperature=0.7,
-                max_output_tokens=800
-            )
-            
-            if response and hasattr(response, 'result') and response.result:
-                analysis = response.result.strip()
-                print(f"✅ AI analysis generated ({len(analysis)} chars)")
-                return analysis
-                
-        except Exception as e:
-            print(f"❌ Legacy API failed: {str(e)}")
-        
-        # Direct REST API fallback
+            index = int(item.get('id'))
+        except (TypeError, ValueError):
+            continue
+        analysis = str(item.get('analysis') or '').strip()
+        if 1 <= index <= count and analysis:
+            results[index] = analysis
+    return results
+
+def _flush_ai_batch():
+    """Kirim headline yang menunggu dalam satu panggilan AI; yang tidak terjawab dianalisis pemanggilnya sendiri"""
+    global _ai_batch_timer
+    with _ai_batch_lock:
+        batch = _ai_batch_pending[:]
+        del _ai_batch_pending[:]
+        _ai_batch_timer = None
+    if not batch:
+        return
+    
+    # Hanya headline yang masih sempat dianalisis sendiri jika batch gagal
+    now = time.time()
+    batchable = [item for item in batch if item[3] is None or item[3] - now >= 2 * AI_BATCH_BUDGET]
+    answered = {}
+    if len(batchable) > 1:
+        print(f"📦 Batching AI analysis for {len(batchable)} headlines")
+        results = {}
         try:
-            print("🔄 Using direct REST API...")
-            import requests
-            
-            url = f"https://generativelanguage.googleapis.com/v1beta2/models/text-bison-001:generateText?key={GEMINI_API_KEY}"
-            payload = {
-                "prompt": {"text": prompt},
-                "temperature": 0.7,
-                "candidateCount": 1
-            }
-            
-            response = requests.post(url, json=payload, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                if 'candidates' in result and result['candidates']:
-                    candidate = result['candidates'][0]
-                    if 'output' in candidate:
-                        analysis = candidate['output'].strip()
-                        print(f"✅ AI analysis generated ({len(analysis)} chars)")
-                        return analysis
-            else:
-                print(f"❌ REST API failed: {response.status_code}")
-                
+            # Budget sendiri untuk batch; JSON yang terpotong deadline tidak bisa di-parse
+            text = generate_ai_text(build_batch_analysis_prompt([item[0] for item in batchable]),
+                                    deadline=now + AI_BATCH_BUDGET)
+            if text and not isinstance(text, TruncatedText):
+                results = parse_batch_analysis(text, len(batchable))
         except Exception as e:
-            print(f"❌ REST API failed: {str(e)}")
-        
-        print("❌ All AI methods failed")
-        return None
-            
-    except Exception as e:
-        print(f"❌ AI analysis error: {str(e)}")
-        return None
+            print(f"❌ Batch AI analysis error: {e}")
+        answered = {item[1]: results[index] for index, item in enumerate(batchable, 1) if index in results}
+        ai_batch_stats['batches'] += 1
+        ai_batch_stats['headlines_batched'] += len(batchable)
+        ai_batch_stats['api_calls_saved'] += max(0, len(answered) - 1)
+        ai_batch_stats['fallbacks'] += len(batchable) - len(answered)
+    
+    for headline, future, on_text, deadline in batch:
+        analysis = answered.get(future)
+        if analysis and on_text:
+            on_text(analysis)
+        # None: headline tunggal atau tidak terjawab batch, worker pemanggil yang menganalisis
+        future.set_result(analysis)
+
+def submit_for_analysis(headline, on_text=None, deadline=None):
+    """Masukkan headline ke micro-batch; Future berisi analysis, atau None jika harus dianalisis sendiri"""
+    global _ai_batch_timer
+    future = Future()
+    flush_now = False
+    with _ai_batch_lock:
+        _ai_batch_pending.append((headline, future, on_text, deadline))
+        if len(_ai_batch_pending) >= AI_BATCH_MAX:
+            if _ai_batch_timer is not None:
+                _ai_batch_timer.cancel()
+                _ai_batch_timer = None
+            flush_now = True
+        elif _ai_batch_timer is None:
+            _ai_batch_timer = threading.Timer(AI_BATCH_WINDOW, _flush_ai_batch)
+            _ai_batch_timer.daemon = True
+            _ai_batch_timer.start()
+    if flush_now:
+        _flush_ai_batch()
+    return future
 
 def format_bloomberg_time(email_date_str):
     """Convert email date string to Bloomberg format like: 08/09/25 14:32:00 UTC+7:00"""
@@ -608,34 +1986,304 @@ def format_bloomberg_time(email_date_str):
         now_utc7 = datetime.utcnow() + timedelta(hours=7)
         return now_utc7.strftime("%m/%d/%y %H:%M:%S UTC+7:00")
 
-def send_to_telegram(headline, date):
-    """Broadcast headline Bloomberg ke semua subscribers dengan AI analysis"""
+def make_alert_id(headline, email_id=None):
+    """ID alert yang stabil dari email + headline (dipakai di callback_data tombol dan outbox)"""
+    key = f"{email_id}:{headline}" if email_id else headline
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+def record_alert_metric(alert_id, **fields):
+    """Catat timing per alert (email masuk, terkirim pertama, analysis siap)"""
+    with _alert_metrics_lock:
+        metric = alert_metrics.setdefault(alert_id, {'alert_id': alert_id})
+        metric.update(fields)
+        alert_metrics.move_to_end(alert_id)
+        while len(alert_metrics) > ALERT_METRICS_LIMIT:
+            alert_metrics.popitem(last=False)
+        return dict(metric)
+
+def get_alert_metrics():
+    """Daftar timing alert terbaru"""
+    with _alert_metrics_lock:
+        return [dict(metric) for metric in alert_metrics.values()]
+
+def get_alert_metrics_summary():
+    """Ringkasan timing alert terbaru: detik dari email masuk sampai terkirim / analysis siap"""
+    metrics = get_alert_metrics()
+    summary = {'alerts': len(metrics)}
+    for field in ('first_delivery', 'analysis_ready'):
+        delays = [metric[field] - metric['email_received'] for metric in metrics
+                  if field in metric and 'email_received' in metric]
+        summary[f'{field}_p50'] = round(_percentile(delays, 50), 2)
+        summary[f'{field}_p99'] = round(_percentile(delays, 99), 2)
+    analysed = [metric['analysis_ok'] for metric in metrics if 'analysis_ok' in metric]
+    summary['analysis_ok_rate'] = round(sum(analysed) / len(analysed), 3) if analysed else None
+    return summary
+
+def get_ai_analysis(alert_id):
+    """Ambil AI analysis yang sudah jadi untuk alert"""
+    ai_data = analysis_store.get(alert_id)
+    return ai_data['analysis'] if ai_data else None
+
+def _run_ai_analysis(alert_id, headline):
+    """Worker background: buat analysis lalu simpan ke cache"""
+    started = time.time()
+    record_alert_metric(alert_id, analysis_started=started)
+    
+    def on_text(text):
+        # Simpan teks parsial supaya tombol bisa menampilkan paragraf pertama lebih dulu
+        if alert_id not in _partial_analyses:
+            metric = record_alert_metric(alert_id, first_token=time.time())
+            print(f"⚡ AI time-to-first-token {metric['first_token'] - started:.2f}s: {headline[:50]}")
+        _partial_analyses[alert_id] = text
+    
+    try:
+        ai_analysis = memoized_ai_analysis(headline, on_text, started + AI_DEADLINE_SECONDS)
+    except Exception as e:
+        print(f"❌ AI analysis error: {e}")
+        ai_analysis = None
+    
+    # Hanya analysis yang lengkap disimpan supaya yang gagal/terpotong bisa dibuat ulang nanti
+    if ai_analysis and not isinstance(ai_analysis, TruncatedText):
+        analysis_store.put(alert_id, headline, ai_analysis)
+    
+    metric = record_alert_metric(alert_id, analysis_ready=time.time(), analysis_ok=bool(ai_analysis),
+                                 generation_seconds=time.time() - started)
+    print(f"⏱️ AI generation took {metric['generation_seconds']:.2f}s: {headline[:50]}")
+    if metric.get('email_received'):
+        print(f"⏱️ AI analysis ready {metric['analysis_ready'] - metric['email_received']:.1f}s "
+              f"after email arrival: {headline[:50]}")
+    return ai_analysis
+
+def start_ai_analysis(alert_id, headline, wait=0):
+    """Masukkan AI analysis ke stage analysis; None jika queue penuh (analysis dibuat saat tombol diklik)"""
+    with _pending_analyses_lock:
+        future = _pending_analyses.get(alert_id)
+        if future is not None:
+            return future
+        future = Future()
+        _pending_analyses[alert_id] = future
+    
+    try:
+        _analysis_queue.put((alert_id, headline, future), block=wait > 0, timeout=wait or None)
+    except queue.Full:
+        # Backpressure: jangan tahan poller karena LLM lambat
+        with _pending_analyses_lock:
+            _pending_analyses.pop(alert_id, None)
+        record_stage('analysis', shed=True)
+        print(f"⚠️ Analysis queue full, skipping background analysis: {headline[:50]}")
+        return None
+    
+    def on_done(_):
+        with _pending_analyses_lock:
+            _pending_analyses.pop(alert_id, None)
+        _partial_analyses.pop(alert_id, None)
+    
+    future.add_done_callback(on_done)
+    return future
+
+def ai_analysis_enabled():
+    """Cek apakah Gemini terkonfigurasi"""
+    return GEMINI_AVAILABLE and bool(GEMINI_API_KEY) and GEMINI_API_KEY != 'YOUR_GEMINI_KEY'
+
+def build_ai_keyboard(alert_id):
+    """Inline keyboard untuk show AI analysis"""
+    return {
+        "inline_keyboard": [[
+            {
+                "text": "📖 Show AI Analysis", 
+                "callback_data": f"show_ai:{alert_id}"
+            }
+        ]]
+    }
+
+_outbox_table_ready = False
+
+def _outbox_db():
+    """Tabel alerts dan outbox (job kirim per alert x subscriber) di SQLite"""
+    global _outbox_table_ready
+    db = get_state_db()
+    if not _outbox_table_ready:
+        with _state_db_lock:
+            db.execute('CREATE TABLE IF NOT EXISTS alerts ('
+                       'alert_id TEXT PRIMARY KEY, email_id TEXT, headline TEXT, text TEXT, keyboard TEXT, '
+                       'received REAL, created REAL)')
+            db.execute('CREATE TABLE IF NOT EXISTS outbox ('
+                       'alert_id TEXT, chat_id TEXT, status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, '
+                       'next_attempt REAL, last_error TEXT, updated REAL, PRIMARY KEY (alert_id, chat_id))')
+            db.execute('CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt)')
+            db.commit()
+        _outbox_table_ready = True
+    return db
+
+def get_alert(alert_id):
+    """Data alert dari outbox (mis. untuk membuat AI analysis setelah restart)"""
+    db = _outbox_db()
+    with _state_db_lock:
+        row = db.execute('SELECT headline, text, received FROM alerts WHERE alert_id = ?', (alert_id,)).fetchone()
+    return {'alert_id': alert_id, 'headline': row[0], 'text': row[1], 'received': row[2]} if row else None
+
+def enqueue_alert(alert_id, email_id, headline, text, keyboard, received_at, chat_ids):
+    """Simpan alert dan satu job per subscriber dalam satu transaksi (idempotent per alert_id)"""
+    now = time.time()
+    db = _outbox_db()
+    with _state_db_lock:
+        cursor = db.execute('INSERT OR IGNORE INTO alerts (alert_id, email_id, headline, text, keyboard, received, created) '
+                            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (alert_id, email_id, headline, text, json.dumps(keyboard) if keyboard else None,
+                             received_at, now))
+        if cursor.rowcount == 0:
+            db.commit()
+            print(f"ℹ️ Alert {alert_id} already in outbox, not enqueued again")
+            return 0
+        db.executemany('INSERT OR IGNORE INTO outbox (alert_id, chat_id, status, attempts, next_attempt, updated) '
+                       "VALUES (?, ?, 'pending', 0, ?, ?)",
+                       [(alert_id, chat_id, now, now) for chat_id in chat_ids])
+        db.commit()
+        outbox_stats['enqueued_alerts'] += 1
+        outbox_stats['enqueued_jobs'] += len(chat_ids)
+    return len(chat_ids)
+
+def get_outbox_depth():
+    """Jumlah job kirim yang belum selesai"""
+    db = _outbox_db()
+    with _state_db_lock:
+        return db.execute("SELECT COUNT(*) FROM outbox WHERE status = 'pending'").fetchone()[0]
+
+def _ack_outbox_jobs(alert_id, results):
+    """Tandai job terkirim; yang gagal dijadwalkan ulang dengan backoff atau ditandai failed"""
+    now = time.time()
+    sent = [(now, alert_id, chat_id) for chat_id, ok, _ in results if ok]
+    failed_ids = [chat_id for chat_id, ok, _ in results if not ok]
+    db = _outbox_db()
+    with _state_db_lock:
+        db.executemany("UPDATE outbox SET status = 'sent', attempts = attempts + 1, updated = ? "
+                       "WHERE alert_id = ? AND chat_id = ?", sent)
+        for chat_id in failed_ids:
+            attempts = db.execute('SELECT attempts FROM outbox WHERE alert_id = ? AND chat_id = ?',
+                                  (alert_id, chat_id)).fetchone()[0] + 1
+            # Chat yang sudah di-prune atau terlalu sering gagal tidak dicoba lagi
+            give_up = attempts >= OUTBOX_MAX_ATTEMPTS or chat_id not in subscribers
+            db.execute('UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, updated = ? '
+                       'WHERE alert_id = ? AND chat_id = ?',
+                       ('failed' if give_up else 'pending', attempts, now + _retry_delay(attempts), now,
+                        alert_id, chat_id))
+            outbox_stats['failed' if give_up else 'retried'] += 1
+        db.commit()
+        outbox_stats['sent'] += len(sent)
+
+def _cleanup_outbox():
+    """Hapus job dan alert lama yang sudah selesai"""
+    cutoff = time.time() - OUTBOX_RETENTION
+    db = _outbox_db()
+    with _state_db_lock:
+        db.execute("DELETE FROM outbox WHERE status != 'pending' AND updated < ?", (cutoff,))
+        db.execute('DELETE FROM alerts WHERE created < ? AND alert_id NOT IN (SELECT alert_id FROM outbox)', (cutoff,))
+        db.commit()
+
+def _deliver_alert(alert_id):
+    """Kirim job alert yang jatuh tempo per OUTBOX_CHUNK, ack setiap chunk"""
+    delivered = 0
+    db = _outbox_db()
+    while True:
+        with _state_db_lock:
+            row = db.execute('SELECT text, keyboard FROM alerts WHERE alert_id = ?', (alert_id,)).fetchone()
+            chat_ids = [r[0] for r in db.execute(
+                "SELECT chat_id FROM outbox WHERE alert_id = ? AND status = 'pending' AND next_attempt <= ? "
+                "LIMIT ?", (alert_id, time.time(), OUTBOX_CHUNK))]
+        if row is None or not chat_ids:
+            return delivered
+        
+        text, keyboard_json = row
+        keyboard = json.loads(keyboard_json) if keyboard_json else None
+        pruned_before = subscriber_prune_stats['pruned']
+        results, stats = _fan_out(
+            lambda chat_id: send_telegram_message_with_keyboard(text, chat_id, keyboard), chat_ids)
+        _ack_outbox_jobs(alert_id, results)
+        delivered += stats['success']
+        
+        print(f"📤 Alert {alert_id}: {stats['success']} sent, {stats['failed']} failed")
+        report_pruned_subscribers(pruned_before)
+        if stats['first_delivery']:
+            with _alert_metrics_lock:
+                metric = alert_metrics.get(alert_id)
+                first_time = metric is not None and 'first_delivery' not in metric
+            if first_time:
+                metric = record_alert_metric(alert_id, first_delivery=stats['first_delivery'])
+                print(f"⏱️ First delivery {metric['first_delivery'] - metric['email_received']:.1f}s "
+                      f"after email arrival")
+
+def drain_outbox(alert_id=None):
+    """Kirim job yang jatuh tempo untuk satu alert, atau semua alert jika alert_id None"""
+    if alert_id is None:
+        db = _outbox_db()
+        with _state_db_lock:
+            alert_ids = [row[0] for row in db.execute(
+                "SELECT o.alert_id FROM outbox o JOIN alerts a ON a.alert_id = o.alert_id "
+                "WHERE o.status = 'pending' AND o.next_attempt <= ? "
+                "GROUP BY o.alert_id ORDER BY MIN(a.created)", (time.time(),))]
+    else:
+        alert_ids = [alert_id]
+    
+    delivered = 0
+    for current_id in alert_ids:
+        # Satu alert hanya dikirim oleh satu worker pada satu waktu
+        with _alerts_in_delivery_lock:
+            if current_id in _alerts_in_delivery:
+                continue
+            _alerts_in_delivery.add(current_id)
+        try:
+            delivered += _deliver_alert(current_id)
+        finally:
+            with _alerts_in_delivery_lock:
+                _alerts_in_delivery.discard(current_id)
+    return delivered
+
+def send_to_telegram(headline, date, received_at=None, email_id=None, title='Bloomberg Alert'):
+    """Masukkan headline Bloomberg ke outbox untuk semua subscribers; AI analysis dibuat di background"""
     try:
         # Format waktu sesuai dengan email Bloomberg
         formatted_time = format_bloomberg_time(date)
+        alert_id = make_alert_id(headline, email_id)
+        record_alert_metric(alert_id, headline=headline, email_received=received_at or time.time(),
+                            detected=time.time())
         
-        # Generate AI analysis
-        print(f"🤖 Generating AI analysis for: {headline[:50]}...")
-        ai_analysis = generate_ai_analysis(headline)
-        
-        if ai_analysis:
-            print(f"✅ AI analysis generated successfully ({len(ai_analysis)} chars)")
+        if ai_analysis_enabled():
+            # Fase 2: analysis jalan paralel, headline tidak menunggu LLM
+            print(f"🤖 Generating AI analysis in background for: {headline[:50]}...")
+            start_ai_analysis(alert_id, headline)
+            
             # Format pesan utama dengan HTML bold formatting
-            message = f"<b>🔔 Bloomberg Alert</b>\n\n" \
+            message = f"<b>🔔 {title}</b>\n\n" \
                      f"{headline}\n\n" \
                      f"{formatted_time}"
-            
-            # Broadcast ke semua subscribers dengan inline keyboard
-            return broadcast_to_subscribers_with_ai(message, headline, ai_analysis)
+            keyboard = build_ai_keyboard(alert_id)
         else:
-            print("❌ AI analysis failed, sending simple alert")
+            print("⚠️ AI analysis disabled, sending simple alert")
             # Send simple alert without AI analysis button
-            message = f"<b>🔔 Bloomberg Alert</b>\n\n" \
+            message = f"<b>🔔 {title}</b>\n\n" \
                      f"{headline}\n\n" \
                      f"{formatted_time}\n\n" \
                      f"<i>AI analysis unavailable</i>"
-            
-            return broadcast_to_subscribers(message)
+            keyboard = None
+        
+        if not subscribers:
+            print("❌ No subscribers to broadcast to")
+        
+        # Fase 1: simpan job kirim secara durable, worker outbox langsung mengirim
+        with _subscribers_lock:
+            chat_ids = list(subscribers)
+        # Hanya subscriber yang topiknya cocok (/follow, /mute) yang dapat job kirim
+        recipients = select_recipients(headline, chat_ids)
+        if len(recipients) < len(chat_ids):
+            print(f"🎯 {len(recipients)}/{len(chat_ids)} subscribers match topics")
+        chat_ids = recipients
+        if enqueue_alert(alert_id, email_id, headline, message, keyboard, received_at, chat_ids):
+            try:
+                _delivery_queue.put_nowait(alert_id)
+            except queue.Full:
+                # Job sudah durable; sweep berkala worker delivery akan mengirimnya
+                record_stage('delivery', shed=True)
+        return True
             
     except Exception as e:
         print(f"❌ Error mengirim ke Telegram: {e}")
@@ -653,190 +2301,1289 @@ def get_last_email_data():
             return json.load(f)
     return None
 
-def get_gmail_service():
-    """Menangani otentikasi dan mengembalikan objek layanan Gmail API"""
+def get_gmail_accounts():
+    """Daftar mailbox dari GMAIL_ACCOUNTS_FILE, atau satu akun default (token.json / GOOGLE_CREDENTIALS_JSON)"""
+    global _gmail_accounts
+    if _gmail_accounts is None:
+        accounts = [DEFAULT_GMAIL_ACCOUNT]
+        if os.path.exists(GMAIL_ACCOUNTS_FILE):
+            with open(GMAIL_ACCOUNTS_FILE, 'r', encoding='utf-8') as f:
+                accounts = json.load(f)
+            names = [account.get('name') for account in accounts]
+            if not accounts or not all(names) or len(set(names)) != len(names):
+                raise ValueError(f"{GMAIL_ACCOUNTS_FILE}: every account needs a unique 'name'")
+        _gmail_accounts = accounts
+    return _gmail_accounts
+
+def _load_gmail_credentials(account):
+    """Memuat credentials Gmail akun dari environment, token file, atau login interaktif"""
     creds = None
+    credentials_env = account.get('credentials_env')
+    token_file = account.get('token_file', f"token_{account['name']}.json")
     
     # Try to load from environment variable first (for production)
-    credentials_json = os.getenv('GOOGLE_CREDENTIALS_JSON')
+    credentials_json = os.getenv(credentials_env) if credentials_env else None
     if credentials_json:
-        import json
-        
         # Parse JSON credentials from environment
         try:
             creds_info = json.loads(credentials_json)
             creds = Credentials.from_authorized_user_info(creds_info, SCOPES)
         except Exception as e:
-            print(f"❌ Error parsing credentials from environment: {e}")
+            print(f"❌ Error parsing credentials from environment ({account['name']}): {e}")
+    
+    # Fallback to local token file
+    if not creds and os.path.exists(token_file):
+        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
     
-    # Fallback to local token.json file
-    if not creds and os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+    if creds and (creds.valid or (creds.expired and creds.refresh_token)):
+        return creds, bool(credentials_json)
+    
+    # Interactive auth only works locally
+    if not credentials_json and os.path.exists('credentials.json'):
+        print(f"🔑 Login Gmail untuk mailbox '{account['name']}'")
+        flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
+        creds = flow.run_local_server(port=0)
+        with open(token_file, 'w') as token:
+            token.write(creds.to_json())
+        return creds, False
+    
+    print(f"❌ No valid credentials available for mailbox '{account['name']}'")
+    return None, bool(credentials_json)
+
+def _credentials_need_refresh(creds):
+    """Cek apakah token sudah/hampir expired"""
+    if not creds.valid:
+        return True
+    if creds.expiry is None:
+        return False
+    # creds.expiry adalah datetime UTC tanpa timezone
+    return creds.expiry - datetime.utcnow() < timedelta(seconds=CREDS_REFRESH_MARGIN)
+
+def _refresh_gmail_credentials(creds):
+    """Refresh access token dan catat durasinya"""
+    started = time.time()
+    creds.refresh(Request())
+    elapsed = time.time() - started
+    gmail_client_stats['refreshes'] += 1
+    gmail_client_stats['last_refresh_seconds'] = elapsed
+    print(f"✅ Token refreshed successfully ({elapsed:.2f}s)")
+
+def _gmail_client_for(account):
+    with _gmail_clients_lock:
+        client = _gmail_clients.get(account['name'])
+        if client is None:
+            client = {'service': None, 'creds': None, 'production': False, 'lock': threading.Lock()}
+            _gmail_clients[account['name']] = client
+        return client
+
+def get_label_names(account, gmail_service, label_ids):
+    """Peta label ID -> nama untuk satu mailbox, di-cache; dimuat ulang jika ada label baru"""
+    client = _gmail_client_for(account)
+    names = client.get('labels')
+    if names is None or any(label_id not in names for label_id in label_ids):
+        results = gmail_service.users().labels().list(userId='me').execute()
+        _record_gmail_calls(1)
+        names = {label['id']: label['name'] for label in results.get('labels', [])}
+        client['labels'] = names
+    return names
+
+def invalidate_gmail_service(reason=None, account=None):
+    """Buang Gmail client supaya dibangun ulang di poll berikutnya (setelah auth gagal)"""
+    account = account or get_gmail_accounts()[0]
+    client = _gmail_client_for(account)
+    with client['lock']:
+        client['service'] = None
+        client['creds'] = None
+    gmail_client_stats['auth_failures'] += 1
+    print(f"⚠️ Gmail client '{account['name']}' invalidated{f': {reason}' if reason else ''}")
+
+def get_gmail_client_stats():
+    """Statistik build/refresh Gmail client"""
+    return dict(gmail_client_stats)
+
+def get_gmail_service(account=None):
+    """Mengembalikan objek layanan Gmail API (per akun) yang dipakai ulang antar poll"""
+    account = account or get_gmail_accounts()[0]
+    client = _gmail_client_for(account)
+    # Lock per akun: refresh token satu mailbox tidak menahan mailbox lain
+    with client['lock']:
+        creds = client['creds']
+        
+        if creds is None:
+            creds, production = _load_gmail_credentials(account)
+            if not creds:
+                return None
+            client['creds'] = creds
+            client['production'] = production
         
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
+        if _credentials_need_refresh(creds):
+            if not creds.refresh_token:
+                print(f"❌ Token expired and no refresh token available ({account['name']})")
+                client['creds'] = None
+                return None
             try:
-                creds.refresh(Request())
-                # Save refreshed token back to environment in production
-                if credentials_json:
-                    print("✅ Token refreshed successfully")
+                _refresh_gmail_credentials(creds)
             except Exception as e:
-                print(f"❌ Error refreshing token: {e}")
-                # In production, we can't do interactive auth, so exit
-                if credentials_json:
+                print(f"❌ Error refreshing token ({account['name']}): {e}")
+                client['service'] = None
+                client['creds'] = None
+                # In production, we can't do interactive auth
+                if client['production']:
                     print("❌ Cannot refresh token in production mode")
-                    return None
-        else:
-            # Interactive auth only works locally
-            if not credentials_json and os.path.exists('credentials.json'):
-                flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
-                creds = flow.run_local_server(port=0)
-                with open('token.json', 'w') as token:
-                    token.write(creds.to_json())
-            else:
-                print("❌ No valid credentials available in production mode")
                 return None
-                
-    return build('gmail', 'v1', credentials=creds)
+        
+        if client['service'] is None:
+            # Build sekali saja: discovery document tidak di-parse ulang setiap poll
+            started = time.time()
+            client['service'] = build('gmail', 'v1', credentials=creds)
+            elapsed = time.time() - started
+            gmail_client_stats['builds'] += 1
+            gmail_client_stats['last_build_seconds'] = elapsed
+            print(f"🔧 Gmail service '{account['name']}' built ({elapsed:.2f}s)")
+        
+        return client['service']
 
-def get_last_processed_id():
-    """Membaca ID email terakhir yang diproses dari file"""
-    if os.path.exists(LAST_PROCESSED_ID_FILE):
+def _sync_state_file(account=None):
+    """Akun default memakai SYNC_STATE_FILE, akun lain gmail_sync_state.<nama>.json"""
+    if account is None or account['name'] == DEFAULT_GMAIL_ACCOUNT['name']:
+        return SYNC_STATE_FILE
+    return f"gmail_sync_state.{account['name']}.json"
+
+def load_sync_state(account=None):
+    """Membaca state sinkronisasi Gmail (cursor historyId dan ID email terakhir) milik satu akun"""
+    state = {'history_id': None, 'recent_ids': []}
+    sync_state_file = _sync_state_file(account)
+    if os.path.exists(sync_state_file):
+        try:
+            with open(sync_state_file, 'r') as f:
+                state.update(json.load(f))
+        except Exception as e:
+            print(f"⚠️ Error reading sync state: {e}")
+    elif sync_state_file == SYNC_STATE_FILE and os.path.exists(LAST_PROCESSED_ID_FILE):
+        # Migrasi dari last_email_id.txt (format lama)
         with open(LAST_PROCESSED_ID_FILE, 'r') as f:
-            content = f.read().strip()
-            return content if content else None
+            old_id = f.read().strip()
+        if old_id:
+            state['recent_ids'] = [old_id]
+    return state
+
+def save_sync_state(state, account=None):
+    """Menyimpan state sinkronisasi Gmail secara atomic"""
+    state['recent_ids'] = state['recent_ids'][-SYNC_RECENT_IDS_LIMIT:]
+    state['updated'] = time.time()
+    sync_state_file = _sync_state_file(account)
+    tmp_file = sync_state_file + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_file, sync_state_file)
+
+def _record_gmail_calls(count):
+    # Mailbox di-poll dari beberapa thread
+    with _fetch_stats_lock:
+        fetch_stats['api_calls'] += count
+
+def _list_history_since(gmail_service, history_id):
+    """Ambil semua message ID yang ditambahkan sejak history_id (urutan kedatangan)"""
+    added_ids = []
+    seen = set()
+    page_token = None
+    latest_history_id = history_id
+    
+    while True:
+        params = {
+            'userId': 'me',
+            'startHistoryId': history_id,
+            'historyTypes': ['messageAdded']
+        }
+        if page_token:
+            params['pageToken'] = page_token
+        results = gmail_service.users().history().list(**params).execute()
+        _record_gmail_calls(1)
+        latest_history_id = results.get('historyId', latest_history_id)
+        
+        for record in results.get('history', []):
+            for added in record.get('messagesAdded', []):
+                message_id = added['message']['id']
+                if HISTORY_SKIP_LABELS.intersection(added['message'].get('labelIds', [])):
+                    continue
+                if message_id not in seen:
+                    seen.add(message_id)
+                    added_ids.append(message_id)
+        
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return added_ids, latest_history_id
+
+class SourceFeed:
+    """Satu feed email: rule dikompilasi jadi query Gmail dan regex post-filter"""
+    
+    def __init__(self, rule):
+        unknown = set(rule) - SOURCE_RULE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown source rule keys: {', '.join(sorted(unknown))}")
+        if not rule.get('name'):
+            raise ValueError("Source rule needs a 'name'")
+        self.name = rule['name']
+        self.title = rule.get('title', 'Bloomberg Alert')
+        self.senders = [sender.lower() for sender in rule.get('from', [])]
+        self.subject_terms = [term.lower() for term in rule.get('subject', [])]
+        self.subject_regex = re.compile(rule['subject_regex'], re.I) if rule.get('subject_regex') else None
+        self.exclude_subject_regex = (re.compile(rule['exclude_subject_regex'], re.I)
+                                      if rule.get('exclude_subject_regex') else None)
+        self.from_regex = re.compile(rule['from_regex'], re.I) if rule.get('from_regex') else None
+        
+        self.labels = {_label_key(label) for label in rule.get('label', [])}
+        newer_than = rule.get('newer_than')
+        if newer_than and not re.fullmatch(r'\d+[dmy]', newer_than):
+            raise ValueError(f"Invalid newer_than for feed {self.name}: {newer_than}")
+        # Perkiraan umur maksimum (Gmail: m = bulan, y = tahun)
+        self.max_age = (int(newer_than[:-1]) * {'d': 86400, 'm': 31 * 86400, 'y': 366 * 86400}[newer_than[-1]]
+                        if newer_than else None)
+        
+        def any_of(field, values):
+            terms = [f'{field}:"{value}"' if ' ' in value else f'{field}:{value}' for value in values]
+            return terms[0] if len(terms) == 1 else '{' + ' '.join(terms) + '}'
+        
+        parts = []
+        if self.senders:
+            parts.append(any_of('from', rule['from']))
+        # Semua label harus ada (AND)
+        parts.extend(f'label:{_label_key(label)}' for label in rule.get('label', []))
+        if self.subject_terms:
+            parts.append(any_of('subject', rule['subject']))
+        if newer_than:
+            parts.append(f'newer_than:{newer_than}')
+        if not parts:
+            raise ValueError(f"Source rule {self.name} has no server-side condition")
+        self.query = ' '.join(parts)
+    
+    def matches(self, email_data):
+        """Cek email terhadap rule: from/subject + regex, label dan umur (history sync tidak difilter Gmail)"""
+        if self.labels and not self.labels <= email_data.get('labels', set()):
+            return False
+        if self.max_age and email_data.get('internal_date') and time.time() - email_data['internal_date'] > self.max_age:
+            return False
+        subject = email_data['subject']
+        sender = email_data['from'].lower()
+        if self.senders and not any(s in sender for s in self.senders):
+            return False
+        if self.subject_terms and not any(term in subject.lower() for term in self.subject_terms):
+            return False
+        if self.subject_regex and not self.subject_regex.search(subject):
+            return False
+        if self.exclude_subject_regex and self.exclude_subject_regex.search(subject):
+            return False
+        if self.from_regex and not self.from_regex.search(email_data['from']):
+            return False
+        return True
+
+def _label_key(name):
+    """Nama label seperti di query Gmail: huruf kecil, spasi dan '/' jadi '-'"""
+    return re.sub(r'[\s/]+', '-', name.strip().lower())
+
+def load_source_rules():
+    """Rule dari SOURCE_RULES_FILE jika ada, selain itu SOURCE_RULES bawaan"""
+    if os.path.exists(SOURCE_RULES_FILE):
+        with open(SOURCE_RULES_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return SOURCE_RULES
+
+def get_source_feeds():
+    """Feed yang sudah dikompilasi (sekali per proses) beserta query gabungannya"""
+    global _source_feeds
+    if _source_feeds is None:
+        feeds = [SourceFeed(rule) for rule in load_source_rules()]
+        if not feeds:
+            raise ValueError("No source rules configured")
+        if len(feeds) == 1:
+            query = feeds[0].query
+        else:
+            # {...} = OR di query Gmail
+            query = '{' + ' '.join(f'({feed.query})' for feed in feeds) + '}'
+        for feed in feeds:
+            source_stats['feeds'].setdefault(feed.name, {'matched': 0})
+        _source_feeds = (feeds, query)
+        print(f"📐 Gmail query: {query}")
+    return _source_feeds
+
+def get_source_query():
+    return get_source_feeds()[1]
+
+def match_source_feed(email_data):
+    """Feed pertama yang cocok dengan email, None jika ditolak semua post-filter"""
+    source_stats['candidates'] += 1
+    for feed in get_source_feeds()[0]:
+        if feed.matches(email_data):
+            source_stats['feeds'][feed.name]['matched'] += 1
+            return feed
+    source_stats['unmatched'] += 1
     return None
 
-def save_last_processed_id(email_id):
-    """Menyimpan ID email yang baru diproses ke file"""
-    with open(LAST_PROCESSED_ID_FILE, 'w') as f:
-        f.write(email_id)
+def get_source_stats():
+    """Match rate per feed terhadap kandidat dari query Gmail"""
+    candidates = source_stats['candidates']
+    report = {'candidates': candidates, 'unmatched': source_stats['unmatched'], 'feeds': {}}
+    for name, stats in source_stats['feeds'].items():
+        report['feeds'][name] = dict(stats, match_rate=round(stats['matched'] / candidates, 3) if candidates else None)
+    return report
+
+def _list_matching_ids(gmail_service, max_results):
+    """Ambil ID email terbaru yang cocok dengan query source rules (terbaru lebih dulu)"""
+    results = gmail_service.users().messages().list(
+        userId='me', q=get_source_query(), maxResults=max(1, min(max_results, 500))
+    ).execute()
+    _record_gmail_calls(1)
+    return [message['id'] for message in results.get('messages', [])]
+
+def _full_sync(gmail_service, state):
+    """Fallback saat cursor tidak ada/expired: list terbatas lalu mulai cursor baru"""
+    # Ambil historyId sebelum list supaya tidak ada email yang terlewat di antaranya
+    profile = gmail_service.users().getProfile(userId='me').execute()
+    _record_gmail_calls(1)
+    history_id = profile.get('historyId')
+    
+    matching_ids = _list_matching_ids(gmail_service, FULL_SYNC_MAX_RESULTS)
+    matching_ids.reverse()  # Urutan kedatangan (terlama lebih dulu)
+    
+    seen = set(state['recent_ids'])
+    if not state.get('history_id') and matching_ids:
+        # Tanpa cursor (run pertama, atau migrasi dari last_email_id.txt): semua email sampai ID
+        # yang sudah diproses dianggap lama; jika tidak ada yang dikenal, hanya kirim email terbaru
+        last_seen = max((i for i, message_id in enumerate(matching_ids) if message_id in seen), default=None)
+        cutoff = last_seen + 1 if last_seen is not None else len(matching_ids) - 1
+        state['recent_ids'].extend(message_id for message_id in matching_ids[:cutoff] if message_id not in seen)
+        matching_ids = matching_ids[cutoff:]
+    
+    seen = set(state['recent_ids'])
+    return [message_id for message_id in matching_ids if message_id not in seen], history_id
+
+def _parse_message_headers(msg):
+    """Ambil header yang dipakai bot dari respons messages.get format metadata"""
+    headers = msg.get('payload', {}).get('headers', [])
+    
+    def header(name, default):
+        return next((h['value'] for h in headers if h['name'].lower() == name.lower()), default)
+    
+    return {
+        'id': msg['id'],
+        'subject': header('Subject', 'No Subject'),
+        'date': header('Date', 'No Date'),
+        'from': header('From', ''),
+        'message_id': header('Message-ID', ''),
+        'internal_date': int(msg.get('internalDate', 0)) / 1000.0,
+        'label_ids': msg.get('labelIds', [])
+    }
+
+def fetch_email_headers(gmail_service, message_ids, gone=None):
+    """Ambil Subject/Date/From untuk email baru, digabung dalam batch jika lebih dari satu
+
+    ID email yang sudah dihapus (404) dimasukkan ke list `gone` supaya tidak menahan cursor.
+    """
+    fetched = {}
+    raw_messages = []
+    gone = gone if gone is not None else []
+    
+    def message_gone(message_id):
+        print(f"🗑️ Email {message_id} no longer exists, skipping")
+        gone.append(message_id)
+    
+    def get_request(message_id):
+        return gmail_service.users().messages().get(
+            userId='me', id=message_id, format='metadata', metadataHeaders=GMAIL_METADATA_HEADERS
+        )
+    
+    if len(message_ids) == 1:
+        try:
+            raw_messages.append(get_request(message_ids[0]).execute())
+        except HttpError as error:
+            if error.resp.status != 404:
+                raise
+            message_gone(message_ids[0])
+        round_trips = 1
+    else:
+        def on_response(request_id, response, exception):
+            if isinstance(exception, HttpError) and exception.resp.status == 404:
+                message_gone(request_id)
+            elif exception is not None:
+                print(f"❌ Error fetching email {request_id}: {exception}")
+            else:
+                raw_messages.append(response)
+        
+        round_trips = 0
+        for i in range(0, len(message_ids), GMAIL_BATCH_LIMIT):
+            batch = gmail_service.new_batch_http_request(callback=on_response)
+            for message_id in message_ids[i:i + GMAIL_BATCH_LIMIT]:
+                batch.add(get_request(message_id), request_id=message_id)
+            batch.execute()
+            round_trips += 1
+    
+    bytes_fetched = 0
+    bytes_saved = 0
+    for msg in raw_messages:
+        fetched[msg['id']] = _parse_message_headers(msg)
+        size = len(json.dumps(msg))
+        bytes_fetched += size
+        # sizeEstimate = ukuran email lengkap yang dulu diambil dengan format='full'
+        bytes_saved += max(0, msg.get('sizeEstimate', 0) - size)
+    
+    round_trips_saved = len(message_ids) - round_trips
+    with _fetch_stats_lock:
+        fetch_stats['messages'] += len(raw_messages)
+        fetch_stats['bytes_fetched'] += bytes_fetched
+        fetch_stats['bytes_saved'] += bytes_saved
+        fetch_stats['round_trips'] += round_trips
+        fetch_stats['round_trips_saved'] += round_trips_saved
+        fetch_stats['api_calls'] += len(message_ids)
+    print(f"📥 Fetched {len(raw_messages)} headers: {bytes_fetched} bytes, "
+          f"~{bytes_saved} bytes saved, {round_trips} round-trip(s) ({round_trips_saved} saved)")
+    
+    # Kembalikan sesuai urutan kedatangan, email yang gagal diambil dilewati
+    return [fetched[message_id] for message_id in message_ids if message_id in fetched]
+
+def list_new_bloomberg_messages(gmail_service, state):
+    """Incremental sync via historyId: kembalikan (ID email baru sesuai urutan kedatangan, historyId baru)"""
+    history_id = state.get('history_id')
+    
+    if history_id:
+        try:
+            added_ids, new_history_id = _list_history_since(gmail_service, history_id)
+        except HttpError as error:
+            if error.resp.status != 404:
+                raise
+            print(f"⚠️ History cursor {history_id} expired, falling back to full list")
+        else:
+            # History tidak bisa difilter dengan query; header yang diambil dicek oleh
+            # match_source_feed (search kedua bisa ketinggalan index dan membuang alert)
+            seen = set(state['recent_ids'])
+            return [message_id for message_id in added_ids if message_id not in seen], new_history_id
+    
+    return _full_sync(gmail_service, state)
+
+def _parse_clock(value):
+    """'HH:MM' -> detik sejak tengah malam"""
+    hours, minutes = value.split(':')
+    return int(hours) * 3600 + int(minutes) * 60
+
+class PollScheduler:
+    """Interval poll Gmail adaptif: jam pasar, aktivitas terakhir, backoff saat sepi/quota, budget harian"""
+    
+    def __init__(self, base=POLL_INTERVAL, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL,
+                 active_window=POLL_ACTIVE_WINDOW, daily_budget=GMAIL_DAILY_API_BUDGET,
+                 market_windows=MARKET_WINDOWS_UTC):
+        self.base = base
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.active_window = active_window
+        self.daily_budget = daily_budget
+        self.market_windows = [(set(days), _parse_clock(start), _parse_clock(end))
+                               for days, start, end in market_windows]
+        self.last_activity = 0.0
+        self.idle_polls = 0
+        self.quota_errors = 0
+        self.quota_until = 0.0
+        self.budget_day = None
+        self.budget_used = 0
+        self.started = time.time()
+        self.latencies = deque(maxlen=500)
+        self.lock = threading.Lock()
+        self.stats = {
+            'polls': 0,
+            'api_calls': 0,
+            'quota_errors': 0,
+            'budget_throttled': 0,
+            'modes': {}
+        }
+    
+    def in_market_window(self, now):
+        """Cek apakah `now` (epoch) berada di salah satu jam pasar"""
+        dt = datetime.utcfromtimestamp(now)
+        seconds = dt.hour * 3600 + dt.minute * 60 + dt.second
+        return any(dt.weekday() in days and start <= seconds < end
+                   for days, start, end in self.market_windows)
+    
+    def _seconds_to_next_window(self, now):
+        """Detik sampai jam pasar berikutnya dimulai (maks. 2 hari ke depan)"""
+        dt = datetime.utcfromtimestamp(now)
+        midnight = now - (dt.hour * 3600 + dt.minute * 60 + dt.second + dt.microsecond / 1e6)
+        starts = [midnight + day * 86400 + start
+                  for day in range(3)
+                  for days, start, _ in self.market_windows
+                  if (dt.weekday() + day) % 7 in days]
+        upcoming = [start - now for start in starts if start > now]
+        return min(upcoming) if upcoming else None
+    
+    def _roll_budget(self, now):
+        day = datetime.utcfromtimestamp(now).date()
+        if day != self.budget_day:
+            self.budget_day = day
+            self.budget_used = 0
+    
+    def record_poll(self, found_new, api_calls, now=None):
+        """Catat hasil satu poll: ada email baru atau tidak, dan berapa request Gmail yang dipakai"""
+        now = now or time.time()
+        with self.lock:
+            self._roll_budget(now)
+            self.budget_used += api_calls
+            self.stats['polls'] += 1
+            self.stats['api_calls'] += api_calls
+            if found_new:
+                self.last_activity = now
+                self.idle_polls = 0
+            else:
+                self.idle_polls += 1
+            if now >= self.quota_until:
+                self.quota_errors = 0
+    
+    def record_quota_error(self, retry_after=None, now=None):
+        """Gmail membalas rate limit/quota: backoff eksponensial (atau sesuai Retry-After)"""
+        now = now or time.time()
+        with self.lock:
+            self.quota_errors += 1
+            self.stats['quota_errors'] += 1
+            delay = min(self.max_interval, self.base * 2 ** self.quota_errors)
+            if retry_after:
+                delay = max(delay, retry_after)
+            self.quota_until = now + delay
+    
+    def record_detection(self, latency):
+        """Detik dari email masuk ke Gmail sampai terdeteksi poller"""
+        if latency >= 0:
+            with self.lock:
+                self.latencies.append(latency)
+    
+    def next_interval(self, now=None):
+        """Detik sampai poll berikutnya, dihitung dari awal poll terakhir"""
+        now = now or time.time()
+        with self.lock:
+            self._roll_budget(now)
+            if now < self.quota_until:
+                mode, interval = 'quota_backoff', self.quota_until - now
+            elif self.in_market_window(now):
+                mode, interval = 'market', self.min_interval
+            elif now - self.last_activity < self.active_window:
+                mode, interval = 'active', self.min_interval
+            elif self.idle_polls >= POLL_IDLE_THRESHOLD:
+                backoff = 2 ** min(self.idle_polls - POLL_IDLE_THRESHOLD + 1, 10)
+                mode, interval = 'idle', min(self.max_interval, self.base * backoff)
+                # Jangan tidur melewati awal jam pasar
+                until_window = self._seconds_to_next_window(now)
+                if until_window is not None:
+                    interval = max(self.min_interval, min(interval, until_window))
+            else:
+                mode, interval = 'normal', self.base
+            
+            # Budget harian: jika pemakaian mendahului jadwal, bagi sisa request ke sisa waktu hari ini
+            polls = max(1, self.stats['polls'])
+            calls_per_poll = max(1.0, self.stats['api_calls'] / polls)
+            remaining_calls = self.daily_budget - self.budget_used
+            dt = datetime.utcfromtimestamp(now)
+            remaining_day = 86400 - (dt.hour * 3600 + dt.minute * 60 + dt.second)
+            budget_interval = 0
+            if remaining_calls <= 0:
+                budget_interval = remaining_day
+            elif remaining_calls / self.daily_budget < remaining_day / 86400:
+                budget_interval = min(remaining_day, remaining_day * calls_per_poll / remaining_calls)
+            if budget_interval > interval:
+                mode, interval = 'budget', budget_interval
+                self.stats['budget_throttled'] += 1
+            
+            self.stats['modes'][mode] = self.stats['modes'].get(mode, 0) + 1
+            return interval, mode
+    
+    def report(self, now=None):
+        """Ringkasan: volume API vs. interval tetap POLL_INTERVAL, dan latency deteksi"""
+        now = now or time.time()
+        with self.lock:
+            hours = max((now - self.started) / 3600, 1 / 60)
+            polls = self.stats['polls']
+            calls_per_poll = self.stats['api_calls'] / polls if polls else 0
+            latencies = list(self.latencies)
+            return {
+                'polls': polls,
+                'api_calls_per_hour': round(self.stats['api_calls'] / hours, 1),
+                'fixed_interval_calls_per_hour': round(3600 / self.base * calls_per_poll, 1),
+                'budget_used_today': self.budget_used,
+                'detection_p50': _percentile(latencies, 50),
+                'detection_p95': _percentile(latencies, 95),
+                'fixed_interval_expected_detection': self.base / 2,
+                'quota_errors': self.stats['quota_errors'],
+                'budget_throttled': self.stats['budget_throttled'],
+                'modes': dict(self.stats['modes'])
+            }
+
+poll_scheduler = PollScheduler()
+_mailbox_executor = ThreadPoolExecutor(max_workers=MAILBOX_POLL_WORKERS, thread_name_prefix='mailbox')
+
+def _is_gmail_quota_error(error):
+    """HttpError karena rate limit/quota Gmail (429 atau 403 *LimitExceeded)"""
+    status = error.resp.status
+    return status == 429 or (status == 403 and ('LimitExceeded' in str(error) or 'quota' in str(error).lower()))
+
+class RecentIdWindow:
+    """Dedup dengan memori tetap: ring buffer + set, ID terlama dibuang saat penuh (O(1) per ID)"""
+    
+    def __init__(self, size):
+        self.size = size
+        self.ring = deque()
+        self.ids = set()
+        self.lock = threading.Lock()
+    
+    def add(self, item_id):
+        """Tambahkan ID; False jika sudah pernah dilihat"""
+        with self.lock:
+            if item_id in self.ids:
+                return False
+            if len(self.ring) >= self.size:
+                self.ids.discard(self.ring.popleft())
+            self.ring.append(item_id)
+            self.ids.add(item_id)
+            return True
+    
+    def __contains__(self, item_id):
+        with self.lock:
+            return item_id in self.ids
+
+processed_updates = RecentIdWindow(UPDATE_DEDUP_WINDOW)  # Track processed update IDs
+_recent_message_ids = RecentIdWindow(MESSAGE_ID_DEDUP_WINDOW)  # Message-ID yang sudah masuk outbox
+
+def load_update_offset():
+    """Membaca offset getUpdates terakhir supaya restart tidak memproses ulang batch terakhir"""
+    if os.path.exists(TELEGRAM_OFFSET_FILE):
+        try:
+            with open(TELEGRAM_OFFSET_FILE, 'r') as f:
+                return int(json.load(f).get('offset', 0))
+        except Exception as e:
+            print(f"⚠️ Error reading update offset: {e}")
+    return 0
+
+def save_update_offset(offset):
+    """Menyimpan offset getUpdates secara atomic"""
+    tmp_file = TELEGRAM_OFFSET_FILE + '.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump({'offset': offset, 'updated': time.time()}, f)
+    os.replace(tmp_file, TELEGRAM_OFFSET_FILE)
+
+def dispatch_update(update):
+    """Arahkan satu update Telegram ke handler command atau callback (dipakai polling dan webhook)"""
+    # Skip if already processed (mis. webhook dikirim ulang Telegram)
+    if not processed_updates.add(update.get('update_id')):
+        return
+    
+    # Handle regular messages (commands)
+    if 'message' in update:
+        message = update['message']
+        if 'text' in message and message['text'].startswith('/'):
+            print(f"📱 Received command: {message['text']}")
+            handle_telegram_command(message)
+    
+    # Handle callback queries (button clicks)
+    elif 'callback_query' in update:
+        callback_query = update['callback_query']
+        print(f"📱 Received callback: {callback_query.get('data')}")
+        handle_callback_query(callback_query)
+
+def _update_chat_key(update):
+    """Chat asal update, dipakai untuk menjaga urutan per chat"""
+    if 'message' in update:
+        return str(update['message'].get('chat', {}).get('id'))
+    if 'callback_query' in update:
+        callback_query = update['callback_query']
+        chat = callback_query.get('message', {}).get('chat') or callback_query.get('from', {})
+        return str(chat.get('id'))
+    return str(update.get('update_id'))
+
+class UpdateDispatcher:
+    """Worker pool untuk update Telegram; update dari chat yang sama diproses berurutan"""
+    
+    def __init__(self, handler, workers):
+        self.handler = handler
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dispatch')
+        self.queues = {}  # chat key -> deque update; ada entry = chat sedang diproses worker
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.handled = 0
+        self.latency_histogram = [0] * (len(HANDLER_LATENCY_BUCKETS) + 1)
+    
+    def submit(self, update):
+        """Masukkan update ke antrian chat-nya, jadwalkan worker jika chat belum diproses"""
+        key = _update_chat_key(update)
+        with self.lock:
+            self.pending += 1
+            pending_updates = self.queues.get(key)
+            if pending_updates is not None:
+                pending_updates.append(update)
+                return
+            self.queues[key] = deque([update])
+        self.executor.submit(self._drain, key)
+    
+    def _drain(self, key):
+        while True:
+            with self.lock:
+                pending_updates = self.queues[key]
+                if not pending_updates:
+                    del self.queues[key]
+                    return
+                update = pending_updates.popleft()
+            
+            started = time.time()
+            try:
+                self.handler(update)
+            except Exception as e:
+                print(f"❌ Error handling update {update.get('update_id')}: {e}")
+            finally:
+                self._record_latency(time.time() - started)
+    
+    def _record_latency(self, latency):
+        bucket = next((i for i, bound in enumerate(HANDLER_LATENCY_BUCKETS) if latency <= bound),
+                      len(HANDLER_LATENCY_BUCKETS))
+        with self.lock:
+            self.pending -= 1
+            self.handled += 1
+            self.latency_histogram[bucket] += 1
+    
+    def queue_depth(self):
+        """Jumlah update yang menunggu atau sedang diproses"""
+        with self.lock:
+            return self.pending
+    
+    def stats(self):
+        """Queue depth dan histogram latency handler (kunci = batas atas bucket dalam detik)"""
+        with self.lock:
+            labels = [f"<={bound}s" for bound in HANDLER_LATENCY_BUCKETS] + [f">{HANDLER_LATENCY_BUCKETS[-1]}s"]
+            return {
+                'queue_depth': self.pending,
+                'active_chats': len(self.queues),
+                'handled': self.handled,
+                'latency_histogram': dict(zip(labels, self.latency_histogram))
+            }
+
+update_dispatcher = UpdateDispatcher(dispatch_update, UPDATE_WORKERS)
 
 def telegram_bot_listener():
     """Thread untuk mendengarkan commands dari Telegram"""
     global last_update_offset
     
     print("🤖 Telegram bot listener started...")
-    processed_messages = set()  # Track processed message IDs
-    processed_callbacks = set()  # Track processed callback query IDs
+    last_update_offset = max(last_update_offset, load_update_offset())
+    error_backoff = 1
     
     while True:
         try:
+            # Long poll: request ditahan server sampai ada update, jadi tidak perlu sleep
             updates = get_telegram_updates(last_update_offset)
             
-            if updates and updates.get('ok'):
-                for update in updates.get('result', []):
-                    last_update_offset = update['update_id'] + 1
-                    
-                    # Handle regular messages (commands)
-                    if 'message' in update:
-                        message = update['message']
-                        message_id = message.get('message_id')
-                        
-                        # Skip if already processed
-                        if message_id in processed_messages:
-                            continue
-                            
-                        if 'text' in message and message['text'].startswith('/'):
-                            print(f"📱 Received command: {message['text']}")
-                            handle_telegram_command(message)
-                            processed_messages.add(message_id)
-                            
-                            # Keep only recent 100 message IDs to prevent memory leak
-                            if len(processed_messages) > 100:
-                                processed_messages = set(list(processed_messages)[-50:])
-                    
-                    # Handle callback queries (button clicks)
-                    elif 'callback_query' in update:
-                        callback_query = update['callback_query']
-                        callback_id = callback_query.get('id')
-                        
-                        # Skip if already processed
-                        if callback_id in processed_callbacks:
-                            continue
-                            
-                        print(f"📱 Received callback: {callback_query.get('data')}")
-                        handle_callback_query(callback_query)
-                        processed_callbacks.add(callback_id)
-                        
-                        # Keep only recent 100 callback IDs to prevent memory leak
-                        if len(processed_callbacks) > 100:
-                            processed_callbacks = set(list(processed_callbacks)[-50:])
+            if updates is None:
+                # Error/konflik: tunggu sebelum coba lagi, makin lama jika terus gagal
+                time.sleep(error_backoff)
+                error_backoff = min(LISTENER_MAX_BACKOFF, error_backoff * 2)
+                continue
+            error_backoff = 1
             
-            time.sleep(2)  # Check for updates every 2 seconds
+            if updates.get('ok') and updates.get('result'):
+                for update in updates['result']:
+                    last_update_offset = update['update_id'] + 1
+                    update_dispatcher.submit(update)
+                save_update_offset(last_update_offset)
             
         except Exception as e:
             print(f"❌ Error in telegram listener: {e}")
-            time.sleep(5)  # Wait before retry
+            time.sleep(error_backoff)  # Wait before retry
+            error_backoff = min(LISTENER_MAX_BACKOFF, error_backoff * 2)
+
+http_routes = {}  # path -> handler(headers, body, query) -> (status, response body)
+
+def _http_response(writer, status, body=b''):
+    """Tulis respons HTTP/1.1 sederhana"""
+    reasons = {200: 'OK', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+               405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    writer.write(f"HTTP/1.1 {status} {reasons.get(status, 'OK')}\r\n"
+                 f"Content-Type: application/json\r\n"
+                 f"Content-Length: {len(body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode('ascii') + body)
+
+async def _handle_http_connection(reader, writer):
+    """Parse satu request HTTP lalu panggil handler sesuai path"""
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=10)
+        parts = request_line.decode('latin-1').split()
+        if len(parts) < 2:
+            _http_response(writer, 400)
+            return
+        method, target = parts[0], parts[1]
+        
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=10)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        
+        length = int(headers.get('content-length') or 0)
+        if length > HTTP_MAX_BODY:
+            _http_response(writer, 413)
+            return
+        body = await asyncio.wait_for(reader.readexactly(length), timeout=10) if length else b''
+        
+        url = urlsplit(target)
+        handler = http_routes.get(url.path)
+        if handler is None:
+            _http_response(writer, 404)
+        elif method != 'POST':
+            _http_response(writer, 405)
+        else:
+            # Handler bisa membaca file state; jangan blokir event loop
+            status, response_body = await asyncio.get_running_loop().run_in_executor(
+                None, handler, headers, body, parse_qs(url.query))
+            _http_response(writer, status, response_body)
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+        print(f"⚠️ Bad HTTP request: {e}")
+        _http_response(writer, 400)
+    except Exception as e:
+        print(f"❌ Error handling HTTP request: {e}")
+        _http_response(writer, 500)
+    finally:
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+async def _serve_http(host, port):
+    server = await asyncio.start_server(_handle_http_connection, host, port)
+    print(f"🌐 HTTP server listening on {host}:{port} ({', '.join(sorted(http_routes))})")
+    async with server:
+        await server.serve_forever()
+
+def start_http_server(host=HTTP_SERVER_HOST, port=HTTP_SERVER_PORT):
+    """Jalankan HTTP server asyncio di thread terpisah"""
+    thread = threading.Thread(target=lambda: asyncio.run(_serve_http(host, port)), daemon=True)
+    thread.start()
+    return thread
+
+def handle_telegram_webhook(headers, body, query):
+    """Terima update dari Telegram: validasi secret token lalu dispatch di background"""
+    if not secrets.compare_digest(headers.get('x-telegram-bot-api-secret-token', ''), TELEGRAM_WEBHOOK_SECRET):
+        print("⚠️ Webhook request with invalid secret token rejected")
+        return 401, '{"ok": false}'
+    try:
+        update = json.loads(body.decode('utf-8'))
+    except ValueError:
+        return 400, '{"ok": false}'
+    if not isinstance(update, dict) or 'update_id' not in update:
+        return 400, '{"ok": false}'
+    
+    # Balas 200 secepatnya, handler jalan di worker dispatcher
+    update_dispatcher.submit(update)
+    return 200, '{"ok": true}'
+
+http_routes[TELEGRAM_WEBHOOK_PATH] = handle_telegram_webhook
+
+def set_webhook():
+    """Daftarkan URL webhook (dengan secret token) ke Telegram"""
+    payload = {
+        'url': TELEGRAM_WEBHOOK_URL,
+        'allowed_updates': json.dumps(TELEGRAM_ALLOWED_UPDATES),
+        'secret_token': TELEGRAM_WEBHOOK_SECRET
+    }
+    response = telegram_api_call('setWebhook', payload, rate_limited=False)
+    if response is not None and response.status_code == 200:
+        print(f"✅ Webhook set to {TELEGRAM_WEBHOOK_URL}")
+        return True
+    print(f"❌ Error setting webhook: {response.text if response is not None else 'no response'}")
+    return False
+
+def gmail_push_enabled():
+    # Topic sungguhan wajib pakai token, kalau tidak siapa pun bisa memicu poll Gmail
+    return bool(GMAIL_PUSH_TOPIC) and (GMAIL_PUSH_TOPIC == 'local' or bool(GMAIL_PUSH_TOKEN))
+
+def ensure_gmail_watch(gmail_service, account=None):
+    """Daftarkan/perbarui users.watch satu mailbox sebelum expired (7 hari)"""
+    account = account or get_gmail_accounts()[0]
+    watch = gmail_push_state['watches'].setdefault(account['name'], {'expiration': 0.0, 'next_attempt': 0.0})
+    now = time.time()
+    if watch['expiration'] - now > GMAIL_WATCH_RENEW_MARGIN or now < watch['next_attempt']:
+        return True
+    
+    try:
+        if GMAIL_PUSH_TOPIC == 'local':
+            # Stand-in lokal: notifikasi datang dari publish_fake_gmail_notification
+            expiration = now + 7 * 24 * 3600
+        else:
+            response = gmail_service.users().watch(userId='me', body={
+                'topicName': GMAIL_PUSH_TOPIC,
+                'labelIds': ['INBOX'],
+                'labelFilterBehavior': 'INCLUDE'
+            }).execute()
+            _record_gmail_calls(1)
+            expiration = int(response['expiration']) / 1000.0
+    except Exception as e:
+        gmail_push_state['watch_failures'] += 1
+        watch['next_attempt'] = now + GMAIL_WATCH_RETRY
+        print(f"❌ Gmail watch failed for '{account['name']}', polling only: {e}")
+        return False
+    
+    if watch['expiration']:
+        gmail_push_state['renewals'] += 1
+    if not gmail_push_state['watch_started']:
+        gmail_push_state['watch_started'] = now
+    watch['expiration'] = expiration
+    gmail_push_state['watch_expiration'] = min(w['expiration'] for w in gmail_push_state['watches'].values())
+    print(f"👀 Gmail watch '{account['name']}' active until {datetime.utcfromtimestamp(expiration):%Y-%m-%d %H:%M} UTC")
+    return True
+
+def gmail_push_healthy(now=None):
+    """Push dianggap sehat jika watch aktif dan notifikasi belum berhenti"""
+    now = now or time.time()
+    last_seen = max(gmail_push_state['last_notification'], gmail_push_state['watch_started'])
+    healthy = (gmail_push_enabled() and gmail_push_state['watch_expiration'] > now
+               and now - last_seen < GMAIL_PUSH_STALE_AFTER)
+    if healthy != gmail_push_state['healthy']:
+        gmail_push_state['healthy'] = healthy
+        if healthy:
+            print("📡 Gmail push healthy, polling only as safety net")
+        elif gmail_push_enabled():
+            gmail_push_state['fallbacks'] += 1
+            print("⚠️ Gmail push notifications stopped, falling back to adaptive polling")
+    return healthy
+
+def handle_gmail_push(headers, body, query):
+    """Terima notifikasi Pub/Sub push dari Gmail: bangunkan poller untuk history sync"""
+    if not gmail_push_enabled():
+        return 404, '{"ok": false}'
+    if GMAIL_PUSH_TOKEN and not secrets.compare_digest(query.get('token', [''])[0], GMAIL_PUSH_TOKEN):
+        print("⚠️ Gmail push request with invalid token rejected")
+        return 401, '{"ok": false}'
+    try:
+        message = json.loads(body.decode('utf-8'))['message']
+        notification = json.loads(base64.b64decode(message['data']).decode('utf-8'))
+        history_id = int(notification['historyId'])
+    except (ValueError, KeyError, TypeError):
+        return 400, '{"ok": false}'
+    
+    gmail_push_state['notifications'] += 1
+    gmail_push_state['last_notification'] = time.time()
+    # historyId hanya bisa dibandingkan dengan cursor mailbox yang sama
+    accounts = get_gmail_accounts()
+    account = next((a for a in accounts if a.get('email', '').lower() == str(notification.get('emailAddress', '')).lower()),
+                   accounts[0] if len(accounts) == 1 else None)
+    cursor = load_sync_state(account).get('history_id') if account else None
+    if cursor and history_id <= int(cursor):
+        # Perubahan ini sudah tercakup sync sebelumnya (Pub/Sub bisa mengirim ulang)
+        gmail_push_state['stale_notifications'] += 1
+    else:
+        _gmail_push_event.set()
+    # 2xx = ack ke Pub/Sub; sync jalan di thread poller
+    return 200, '{"ok": true}'
+
+http_routes[GMAIL_PUSH_PATH] = handle_gmail_push
+
+def publish_fake_gmail_notification(history_id, email_address='me', url=None):
+    """Publisher lokal: kirim notifikasi berformat Pub/Sub push ke endpoint Gmail push bot"""
+    if url is None:
+        url = f"http://127.0.0.1:{HTTP_SERVER_PORT}{GMAIL_PUSH_PATH}"
+        if GMAIL_PUSH_TOKEN:
+            url += f"?token={GMAIL_PUSH_TOKEN}"
+    data = json.dumps({'emailAddress': email_address, 'historyId': str(history_id)})
+    envelope = {
+        'message': {
+            'data': base64.b64encode(data.encode('utf-8')).decode('ascii'),
+            'messageId': str(random.getrandbits(48)),
+            'publishTime': datetime.utcnow().isoformat() + 'Z'
+        },
+        'subscription': 'projects/local/subscriptions/gmail-push'
+    }
+    response = requests.post(url, json=envelope, timeout=10)
+    print(f"📨 Published fake Gmail notification (historyId {history_id}): HTTP {response.status_code}")
+    return response.status_code
+
+def _handle_gmail_error(error, account):
+    """Error Gmail satu mailbox: auth gagal -> client dibangun ulang, quota -> poller backoff"""
+    if isinstance(error, HttpError):
+        print(f"❌ Terjadi kesalahan API ({account['name']}): {error}")
+        if error.resp.status == 401:
+            invalidate_gmail_service('HTTP 401', account)
+        elif _is_gmail_quota_error(error):
+            retry_after = error.resp.get('retry-after')
+            poll_scheduler.record_quota_error(float(retry_after) if retry_after and retry_after.isdigit() else None)
+    elif isinstance(error, RefreshError):
+        print(f"❌ Gagal refresh token Gmail ({account['name']}): {error}")
+        invalidate_gmail_service('refresh failed', account)
+    else:
+        print(f"❌ Terjadi kesalahan umum ({account['name']}): {error}")
+
+def poll_mailbox(account):
+    """List + fetch header email baru dari satu mailbox; None jika mailbox gagal di-poll"""
+    try:
+        gmail_service = get_gmail_service(account)
+        if not gmail_service:
+            print(f"❌ Gmail service '{account['name']}' not available")
+            return None
+        state = load_sync_state(account)
+        new_ids, new_history_id = list_new_bloomberg_messages(gmail_service, state)
+        gone = []
+        emails = fetch_email_headers(gmail_service, new_ids, gone) if new_ids else []
+        # Email yang dihapus sebelum sempat diambil dianggap sudah diproses
+        state['recent_ids'].extend(gone)
+        if emails and any(feed.labels for feed in get_source_feeds()[0]):
+            label_ids = [label_id for email_data in emails for label_id in email_data['label_ids']]
+            label_names = get_label_names(account, gmail_service, label_ids)
+            for email_data in emails:
+                email_data['labels'] = {_label_key(label_names.get(i, i)) for i in email_data['label_ids']}
+    except Exception as error:
+        _handle_gmail_error(error, account)
+        return None
+    return {
+        'account': account,
+        'state': state,
+        'history_changed': new_history_id != state.get('history_id'),
+        'new_history_id': new_history_id,
+        'emails': emails,
+        # Email yang gagal diambil diulang di poll berikutnya
+        'complete': len(emails) + len(gone) == len(new_ids)
+    }
 
 def check_bloomberg_emails():
-    """Fungsi utama untuk mengecek email Bloomberg"""
+    """Fungsi utama untuk mengecek email Bloomberg di semua mailbox"""
     global monitoring_active
     
     if not monitoring_active:
         return False
     
     try:
-        gmail_service = get_gmail_service()
-        last_processed_id = get_last_processed_id()
+        accounts = get_gmail_accounts()
 
-        # Mencari satu email terbaru dari Bloomberg
+        # Ambil semua email Bloomberg baru sejak cursor terakhir tiap mailbox
         print("Mencari email dari Bloomberg...")
-        results = gmail_service.users().messages().list(userId='me', q="bloomberg", maxResults=1).execute()
-        messages = results.get('messages', [])
-        print(f"Ditemukan {len(messages)} email dengan kata 'bloomberg'")
+        if len(accounts) == 1:
+            polls = [poll_mailbox(accounts[0])]
+        else:
+            # Mailbox di-poll bersamaan: total waktu ~ satu round-trip, bukan N
+            polls = list(_mailbox_executor.map(poll_mailbox, accounts))
+        polls = [poll for poll in polls if poll is not None]
 
-        if not messages:
-            last_id = get_last_processed_id()
+        # Gabungkan jadi satu stream sesuai urutan kedatangan
+        merged = sorted(((email_data, poll) for poll in polls for email_data in poll['emails']),
+                        key=lambda item: item[0]['internal_date'])
+
+        if not merged:
+            for poll in polls:
+                if poll['history_changed'] and poll['complete']:
+                    poll['state']['history_id'] = poll['new_history_id']
+                    save_sync_state(poll['state'], poll['account'])
             last_data = get_last_email_data()
-            if last_id and last_data:
-                print(f"Tidak ada email baru. Data terakhir: {last_id}")
+            if last_data:
+                print(f"Tidak ada email baru. Headline terakhir: {last_data[1]}")
             else:
                 print("Tidak ada email dari Bloomberg yang ditemukan.")
             return False
 
-        latest_email_id = messages[0]['id']
+        print(f"📬 Ditemukan {len(merged)} email Bloomberg baru dari {len(polls)} mailbox")
+        sent_count = 0
 
-        # Memeriksa apakah email terbaru sudah pernah diproses
-        if latest_email_id == last_processed_id:
-            print(f"Email terbaru sudah diproses: {latest_email_id}")
-            return False
+        for email_data, poll in merged:
+            state = poll['state']
+            message_id = email_data['id']
+            subject = email_data['subject']
+            date = email_data['date']
 
-        # Jika email berbeda, proses email tersebut
-        message = messages[0]
-        msg = gmail_service.users().messages().get(userId='me', id=message['id'], format='full').execute()
-        headers = msg['payload']['headers']
-        
-        # Ambil hanya subject (headline) dan tanggal
-        subject = next((header['value'] for header in headers if header['name'] == 'Subject'), 'No Subject')
-        date = next((header['value'] for header in headers if header['name'] == 'Date'), 'No Date')
-
-        # Format data untuk backup: [Waktu, Headline]
-        email_row = [date, subject]
-        save_last_email_data(email_row)
-
-        print(f"📧 Data email baru:")
-        print(f"   Waktu: {date}")
-        print(f"   Headline: {subject}")
-
-        # Kirim headline ke Telegram
-        if send_to_telegram(subject, date):
-            print("✅ Headline berhasil dikirim ke Telegram")
-            # Simpan ID email terbaru yang berhasil diproses
-            save_last_processed_id(latest_email_id)
-            print("🎉 Berhasil memproses email Bloomberg")
-            return True
-        else:
-            print("❌ Gagal mengirim ke Telegram, tidak menyimpan ID")
-            return False
+            # Email yang sama bisa di-forward ke beberapa mailbox
+            dedup_key = email_data['message_id'] or f"{poll['account']['name']}:{message_id}"
+            if dedup_key in _recent_message_ids:
+                print(f"♻️ Email {message_id} ({poll['account']['name']}) sudah diterima dari mailbox lain")
+                state['recent_ids'].append(message_id)
+                continue
+
+            feed = match_source_feed(email_data)
+            if feed is None:
+                print(f"🚫 Email {message_id} ditolak filter source: {subject[:60]}")
+                state['recent_ids'].append(message_id)
+                continue
+
+            # Cerita yang sama dari feed/mailbox lain (UPDATE 1:, (Corrected), dst.)
+            duplicate = headline_dedup.check(subject) if HEADLINE_DEDUP_ENABLED else None
+            if duplicate:
+                kind, original, score = duplicate
+                print(f"♻️ Headline duplikat ({kind}, {score:.2f}) dari '{original[:50]}': {subject[:50]}")
+                _recent_message_ids.add(dedup_key)
+                state['recent_ids'].append(message_id)
+                continue
+
+            # Format data untuk backup: [Waktu, Headline]
+            email_row = [date, subject]
+            save_last_email_data(email_row)
+
+            print(f"📧 Data email baru:")
+            print(f"   Waktu: {date}")
+            print(f"   Headline: {subject}")
+            print(f"   Feed: {feed.name} ({poll['account']['name']})")
+
+            if email_data['internal_date']:
+                poll_scheduler.record_detection(time.time() - email_data['internal_date'])
+
+            # Kirim headline ke Telegram
+            if send_to_telegram(subject, date, email_data['internal_date'], dedup_key, feed.title):
+                print("✅ Headline masuk outbox Telegram")
+                # Simpan ID email yang berhasil diproses
+                _recent_message_ids.add(dedup_key)
+                if HEADLINE_DEDUP_ENABLED:
+                    headline_dedup.add(subject)
+                state['recent_ids'].append(message_id)
+                sent_count += 1
+            else:
+                print(f"❌ Gagal memasukkan ke outbox, email {message_id} akan dicoba lagi")
+                poll['complete'] = False
+
+        # Cursor hanya maju jika semua email mailbox itu terkirim, sisanya diulang di poll berikutnya
+        for poll in polls:
+            if poll['complete']:
+                poll['state']['history_id'] = poll['new_history_id']
+            save_sync_state(poll['state'], poll['account'])
+
+        if sent_count:
+            print(f"🎉 Berhasil memproses {sent_count} email Bloomberg")
+        return sent_count > 0
 
-    except HttpError as error:
-        print(f'❌ Terjadi kesalahan API: {error}')
-        return False
     except Exception as e:
         print(f'❌ Terjadi kesalahan umum: {e}')
         return False
 
+def record_stage(stage, seconds=None, shed=False, error=False):
+    """Catat metrik per stage pipeline"""
+    with _pipeline_stats_lock:
+        stats = pipeline_stats[stage]
+        if seconds is not None:
+            stats['processed'] += 1
+            stats['busy_seconds'] += seconds
+        if shed:
+            stats['shed'] += 1
+        if error:
+            stats['errors'] += 1
+
+def get_pipeline_stats():
+    """Metrik per stage: jumlah diproses, rata-rata durasi, queue depth, shed"""
+    depths = {'poller': 0, 'analysis': _analysis_queue.qsize(), 'delivery': _delivery_queue.qsize()}
+    with _pipeline_stats_lock:
+        report = {}
+        for stage, stats in pipeline_stats.items():
+            report[stage] = dict(stats, queue_depth=depths[stage],
+                                 avg_seconds=stats['busy_seconds'] / stats['processed'] if stats['processed'] else 0.0)
+    report['delivery']['outbox_pending'] = get_outbox_depth()
+    return report
+
+def analysis_stage_worker():
+    """Stage analysis: ambil headline dari queue, buat AI analysis, isi Future-nya"""
+    while True:
+        alert_id, headline, future = _analysis_queue.get()
+        started = time.time()
+        try:
+            future.set_result(_run_ai_analysis(alert_id, headline))
+        except Exception as e:
+            print(f"❌ Analysis stage error: {e}")
+            future.set_result(None)
+            record_stage('analysis', error=True)
+        finally:
+            record_stage('analysis', time.time() - started)
+            _analysis_queue.task_done()
+
+def _maybe_cleanup_outbox():
+    """Bersihkan outbox paling sering sekali per OUTBOX_CLEANUP_INTERVAL (oleh satu worker saja)"""
+    with _outbox_cleanup_lock:
+        if time.time() < _outbox_cleanup['next']:
+            return
+        _outbox_cleanup['next'] = time.time() + OUTBOX_CLEANUP_INTERVAL
+    _cleanup_outbox()
+
+def delivery_stage_worker():
+    """Stage delivery: kirim alert baru dari queue; saat idle, sweep job retry/resume di outbox"""
+    while True:
+        try:
+            alert_id = _delivery_queue.get(timeout=OUTBOX_POLL_INTERVAL)
+        except queue.Empty:
+            alert_id = None
+        started = time.time()
+        try:
+            delivered = drain_outbox(alert_id)
+            if alert_id is not None or delivered:
+                record_stage('delivery', time.time() - started)
+            if alert_id is None:
+                _maybe_cleanup_outbox()
+        except Exception as e:
+            print(f"❌ Delivery stage error: {e}")
+            record_stage('delivery', error=True)
+        finally:
+            if alert_id is not None:
+                _delivery_queue.task_done()
+
+def start_pipeline_workers():
+    """Jalankan worker stage analysis dan delivery"""
+    print(f"📮 Starting pipeline: {AI_ANALYSIS_WORKERS} analysis workers, {DELIVERY_WORKERS} delivery workers "
+          f"({get_outbox_depth()} pending jobs in outbox)")
+    for i in range(AI_ANALYSIS_WORKERS):
+        threading.Thread(target=analysis_stage_worker, name=f'analysis-{i}', daemon=True).start()
+    for i in range(DELIVERY_WORKERS):
+        threading.Thread(target=delivery_stage_worker, name=f'delivery-{i}', daemon=True).start()
+
+def poller_stage():
+    """Stage poller: cek email dengan interval adaptif atau saat ada notifikasi Gmail push"""
+    next_report = time.time() + PIPELINE_REPORT_INTERVAL
+    last_mode = None
+    while True:
+        # Notifikasi yang datang selama poll ini membangunkan poll berikutnya
+        _gmail_push_event.clear()
+        started = time.time()
+        if monitoring_active:
+            if gmail_push_enabled():
+                for account in get_gmail_accounts():
+                    gmail_service = get_gmail_service(account)
+                    if gmail_service:
+                        ensure_gmail_watch(gmail_service, account)
+            calls_before = fetch_stats['api_calls']
+            found_new = False
+            try:
+                found_new = check_bloomberg_emails()
+            except Exception as e:
+                print(f"❌ Poller stage error: {e}")
+                record_stage('poller', error=True)
+            record_stage('poller', time.time() - started)
+            poll_scheduler.record_poll(found_new, fetch_stats['api_calls'] - calls_before)
+            interval, mode = poll_scheduler.next_interval()
+            if gmail_push_healthy() and mode not in ('quota_backoff', 'budget'):
+                mode, interval = 'push', max(interval, GMAIL_PUSH_SAFETY_INTERVAL)
+        else:
+            interval, mode = POLL_INTERVAL, 'paused'
+        
+        if time.time() >= next_report:
+            next_report = time.time() + PIPELINE_REPORT_INTERVAL
+            print(f"📊 Pipeline stats: {get_pipeline_stats()}")
+            print(f"📊 Poll scheduler: {poll_scheduler.report()}")
+            print(f"📊 Sources: {get_source_stats()}")
+            print(f"📊 Headline dedup: {headline_dedup.get_stats()}")
+            print(f"📊 Topic filters: {topic_stats}")
+            print(f"📊 Telegram updates: {update_dispatcher.stats()}")
+            print(f"📊 Telegram scheduler: queue depth {get_telegram_queue_depth()}, {get_telegram_scheduler_stats()}")
+            print(f"📊 AI memo: {ai_memo_stats}")
+            print(f"📊 AI batching: {ai_batch_stats}")
+            print(f"📊 Outbox: {outbox_stats}")
+            print(f"📊 Gmail clients: {get_gmail_client_stats()}")
+            print(f"📊 Alert timing: {get_alert_metrics_summary()}")
+            if gmail_push_enabled():
+                print(f"📊 Gmail push: {gmail_push_state}")
+        
+        # Interval dihitung dari awal poll ini; poll yang lebih lama dari interval langsung disusul sekali
+        delay = max(0.0, started + interval - time.time())
+        if mode != last_mode:
+            print(f"⏳ Poll mode: {mode}, next Gmail poll in {delay:.0f}s")
+            last_mode = mode
+        if mode in ('quota_backoff', 'budget', 'paused'):
+            time.sleep(delay)
+        elif _gmail_push_event.wait(delay):
+            # Paling banyak satu poll per POLL_MIN_INTERVAL; notifikasi beruntun digabung jadi satu poll
+            time.sleep(max(0.0, started + POLL_MIN_INTERVAL - time.time()))
+            print("📡 Gmail push notification, syncing now")
+
 def main():
     """Fungsi utama bot"""
     global monitoring_active
@@ -844,9 +3591,25 @@ def main():
     print("🤖 Kojin Bloomberg Alert Bot Starting...")
     print("="*50)
     
-    # Clear webhook untuk menghindari konflik
-    print("🧹 Clearing any existing webhooks...")
-    clear_webhook()
+    webhook_mode = TELEGRAM_UPDATE_MODE == 'webhook'
+    if webhook_mode:
+        # Webhook: Telegram mengirim update ke HTTP server lokal, tanpa polling
+        print("🌐 Using webhook mode for Telegram updates")
+        if not os.getenv('TELEGRAM_WEBHOOK_SECRET'):
+            print("🔐 TELEGRAM_WEBHOOK_SECRET not set, using a random secret for this run")
+        if TELEGRAM_WEBHOOK_URL:
+            set_webhook()
+        else:
+            print("⚠️ TELEGRAM_WEBHOOK_URL not set, only accepting local POSTs")
+    else:
+        # Clear webhook untuk menghindari konflik
+        print("🧹 Clearing any existing webhooks...")
+        clear_webhook()
+    
+    # Kompilasi source rules sekali; rule yang salah langsung gagal saat start
+    get_source_feeds()
+    accounts = get_gmail_accounts()
+    print(f"📮 Gmail mailboxes: {', '.join(account['name'] for account in accounts)}")
     
     # Load subscribers dan status monitoring dari file
     load_subscribers()
@@ -859,20 +3622,32 @@ def main():
         print("⏸️ Monitoring is inactive, waiting for /start command...")
         send_telegram_message("🤖 Kojin Bloomberg Bot Ready\n\nSend /start to begin monitoring Bloomberg emails")
     
-    # Start Telegram bot listener in separate thread
-    telegram_thread = threading.Thread(target=telegram_bot_listener, daemon=True)
-    telegram_thread.start()
+    # Worker analysis dan delivery; delivery melanjutkan job outbox yang belum terkirim sebelum restart
+    start_pipeline_workers()
+    
+    if webhook_mode or gmail_push_enabled():
+        start_http_server()
+    if gmail_push_enabled():
+        print(f"📡 Gmail push mode (topic: {GMAIL_PUSH_TOPIC}), polling as fallback")
+    elif GMAIL_PUSH_TOPIC:
+        print("⚠️ GMAIL_PUSH_TOPIC set without GMAIL_PUSH_TOKEN, Gmail push disabled (polling only)")
+    if not webhook_mode:
+        # Start Telegram bot listener in separate thread
+        telegram_thread = threading.Thread(target=telegram_bot_listener, daemon=True)
+        telegram_thread.start()
+    
+    # Probe backend AI sekali di background, hot path langsung pakai tier yang sehat
+    if ai_analysis_enabled():
+        threading.Thread(target=ai_backend_monitor, daemon=True).start()
     
     print("🚀 Bot started! Listening for Telegram commands...")
     print("📱 Send /start to your bot to begin monitoring")
-    print("🔍 Checking emails every 30 seconds when active")
+    print(f"🔍 Checking emails every {POLL_MIN_INTERVAL}-{POLL_MAX_INTERVAL}s (adaptive) when active")
     print("❌ Press Ctrl+C to stop")
     
     try:
-        while True:
-            if monitoring_active:
-                check_bloomberg_emails()
-            time.sleep(30)  # Check emails every 30 seconds
+        # Poller jalan di main thread, stage lain di thread masing-masing
+        poller_stage()
     except KeyboardInterrupt:
         print("\n🛑 Stopping bot...")
         monitoring_active = False
@@ -881,4 +3656,12 @@ def main():
         print("👋 Bot stopped!")
 
 if __name__ == '__main__':
-    main()
+    import sys
+    if len(sys.argv) == 3 and sys.argv[1] == '--import-subscribers':
+        import_subscribers(sys.argv[2])
+    elif len(sys.argv) == 3 and sys.argv[1] == '--export-subscribers':
+        export_subscribers(sys.argv[2])
+    elif len(sys.argv) == 3 and sys.argv[1] == '--fake-gmail-push':
+        publish_fake_gmail_notification(sys.argv[2])
+    else:
+        main()